@@ -1,63 +1,47 @@
-from flask import Flask, render_template, request, redirect, url_for, send_file, flash, after_this_request
+from flask import Flask, render_template, request, url_for, send_file, after_this_request, jsonify, Response
 import os
+import sys
 import time
+import uuid
+import base64
+import json
 import gc
 import shutil
 from werkzeug.utils import secure_filename
 import urllib.request
-import cv2
-from ultralytics import YOLO
-import torch
-from PIL import Image
-import util
-from sort.sort import Sort
-from util import get_car, read_license_plate, write_csv
-import numpy as np
-import subprocess
-import pandas as pd
-
-# Fix for newer Pillow versions
-if not hasattr(Image, 'ANTIALIAS'):
-    Image.ANTIALIAS = Image.LANCZOS
-
-# Patch torch.load for PyTorch 2.6+
-_original_torch_load = torch.load
-def _patched_torch_load(*args, **kwargs):
-    kwargs['weights_only'] = False
-    return _original_torch_load(*args, **kwargs)
-torch.load = _patched_torch_load
-
-# Global model cache - load once, reuse
-_models_cache = {'coco': None, 'plate': None}
-
-def load_models():
-    """Load models once and cache them to save memory"""
-    if _models_cache['coco'] is None:
-        print("Loading YOLO models...")
-        
-        # Force garbage collection before loading
-        gc.collect()
-        
-        # Load models with minimal settings for memory efficiency
-        _models_cache['coco'] = YOLO('yolov8n.pt')
-        _models_cache['coco'].overrides['verbose'] = False
-        
-        # Clear cache between model loads
-        gc.collect()
-        
-        _models_cache['plate'] = YOLO('license_plate_detector.pt')
-        _models_cache['plate'].overrides['verbose'] = False
-        
-        # Final cleanup
-        gc.collect()
-        print("Models loaded successfully!")
-    return _models_cache['coco'], _models_cache['plate']
+from jobs import JobManager, JobQueueFull
+from checkpoint import JOB_NAME, JobClaim, write_job_file, find_resumable_jobs
+from batcher import MicroBatcher
+from memory import governor, halvings, current_rss_mb
+import metrics
+from warmup import WarmUp
+
+# The processing engine (OpenCV, PyTorch, YOLO, SORT) is not imported here so the
+# web tier can serve the index page and health checks as soon as Flask is up.
+# It is imported by the first request that needs it, or by the warm-up thread.
+
+def process_video(*args, claim=None, **kwargs):
+    """Run a video job with the processing engine, then release its JobClaim"""
+    from pipeline import process_video
+    try:
+        return process_video(*args, **kwargs)
+    finally:
+        if claim is not None:
+            claim.release()
+
+def recognize_images(images):
+    """Run a batch of still images through the processing engine"""
+    from pipeline import recognize_images
+    return recognize_images(images)
 
 def cleanup_old_files(folder, max_age_hours=1):
     """Delete files older than max_age_hours to free up space"""
     try:
         current_time = time.time()
         for filename in os.listdir(folder):
+            # Dot entries hold state, e.g. the job state dir outputs/.jobs
+            if filename.startswith('.'):
+                continue
             filepath = os.path.join(folder, filename)
             if os.path.isfile(filepath):
                 file_age = current_time - os.path.getmtime(filepath)
@@ -94,16 +78,45 @@ def download_model_if_needed(filename, url=None):
 # LICENSE_PLATE_URL = 'https://github.com/kishanpatel486630/Car_Numberplate_Detaction_Project_COD/releases/download/v1.0.0/license_plate_detector.pt'
 # download_model_if_needed('license_plate_detector.pt', LICENSE_PLATE_URL)
 
-# Set environment variables for memory optimization
-os.environ['TORCH_HOME'] = '/tmp/.cache/torch' if os.environ.get('RENDER') else '.cache/torch'
-os.environ['YOLO_CONFIG_DIR'] = '/tmp/.config/Ultralytics' if os.environ.get('RENDER') else '.config/Ultralytics'
-
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'your-secret-key-here-change-in-production')
-app.config['UPLOAD_FOLDER'] = '/tmp/uploads' if os.environ.get('RENDER') else 'uploads'
-app.config['OUTPUT_FOLDER'] = '/tmp/outputs' if os.environ.get('RENDER') else 'outputs'
+app.config['UPLOAD_FOLDER'] = os.environ.get('ANPR_UPLOAD_FOLDER') or ('/tmp/uploads' if os.environ.get('RENDER') else 'uploads')
+app.config['OUTPUT_FOLDER'] = os.environ.get('ANPR_OUTPUT_FOLDER') or ('/tmp/outputs' if os.environ.get('RENDER') else 'outputs')
 app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 50MB max for memory efficiency
 app.config['ALLOWED_EXTENSIONS'] = {'mp4', 'avi', 'mov', 'mkv'}
+# Background processing: concurrent jobs and how many may wait for a worker
+app.config['MAX_WORKERS'] = int(os.environ.get('ANPR_MAX_WORKERS', 1))
+app.config['MAX_QUEUE'] = int(os.environ.get('ANPR_MAX_QUEUE', 4))
+
+# Live stream ingestion opens arbitrary cameras/URLs, so it is opt-in
+app.config['ENABLE_STREAMS'] = os.environ.get('ANPR_ENABLE_STREAMS') == '1'
+app.config['MAX_STREAMS'] = int(os.environ.get('ANPR_MAX_STREAMS', 1))
+# Image API: concurrent requests are coalesced for up to BATCH_WINDOW_MS
+app.config['BATCH_WINDOW_MS'] = float(os.environ.get('ANPR_BATCH_WINDOW_MS', 10))
+app.config['MAX_BATCH'] = int(os.environ.get('ANPR_MAX_BATCH', 8))
+app.config['MAX_IMAGES_PER_REQUEST'] = 16
+# Load the models in the background at startup instead of on the first upload
+app.config['WARMUP'] = os.environ.get('ANPR_WARMUP', '1') == '1'
+# Re-queue jobs interrupted by the previous process at startup
+app.config['RESUME_JOBS'] = os.environ.get('ANPR_RESUME_JOBS', '1') == '1'
+
+# Job status goes to disk too, so any prefork worker can answer for any job
+jobs = JobManager(max_workers=app.config['MAX_WORKERS'], max_queue=app.config['MAX_QUEUE'],
+                  state_dir=os.path.join(app.config['OUTPUT_FOLDER'], '.jobs'))
+live_streams = {}
+image_batcher = MicroBatcher(recognize_images, max_batch=app.config['MAX_BATCH'],
+                             max_wait_ms=app.config['BATCH_WINDOW_MS'])
+
+# Under memory pressure, run smaller image batches and keep fewer finished jobs
+governor.register('image_batch', halvings(app.config['MAX_BATCH']),
+                  lambda size: setattr(image_batcher, 'max_batch', size))
+governor.register('finished_jobs', [100, 50, 20, 10], lambda count: setattr(jobs, 'max_finished', count))
+
+metrics.Gauge('anpr_jobs_in_flight', 'Video jobs being processed', function=lambda: jobs.stats()['running'])
+metrics.Gauge('anpr_job_queue_depth', 'Video jobs waiting for a worker', function=lambda: jobs.stats()['queued'])
+metrics.Gauge('anpr_frames_per_second', 'Combined processing speed of running jobs', function=lambda: jobs.stats()['fps'])
+metrics.Gauge('process_resident_memory_bytes', 'Resident memory of this process',
+              function=lambda: current_rss_mb() * 1024 * 1024)
 
 # Create folders if they don't exist
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
@@ -113,218 +126,191 @@ os.makedirs(app.config['OUTPUT_FOLDER'], exist_ok=True)
 cleanup_old_files(app.config['UPLOAD_FOLDER'], max_age_hours=1)
 cleanup_old_files(app.config['OUTPUT_FOLDER'], max_age_hours=1)
 
+def resume_interrupted_jobs(resumable=None):
+    """
+    Re-queue jobs that were running when the previous process died.
+
+    Args:
+        resumable (list): find_resumable_jobs() output, e.g. collected by the prefork
+            master before forking; None scans OUTPUT_FOLDER now.
+    """
+    if resumable is None:
+        resumable = find_resumable_jobs(app.config['OUTPUT_FOLDER'])
+    for output_folder, info in resumable:
+        # Queued or running in another worker
+        claim = JobClaim.acquire(output_folder)
+        if claim is None:
+            continue
+        if not os.path.exists(os.path.join(output_folder, JOB_NAME)):
+            # Finished between the scan and the claim
+            claim.release()
+            continue
+        try:
+            jobs.submit(process_video, info['video_path'], output_folder, profile=info['meta'].get('profile'),
+                        output_mode=info['meta'].get('output_mode'), claim=claim,
+                        meta=info['meta'], job_id=info['job_id'])
+            print(f"Resuming job {info['job_id']}")
+        except JobQueueFull:
+            claim.release()
+            print(f"Job queue full, not resuming job {info['job_id']}")
+            break
+
+# Loads the models in the background at startup; prefork.py runs it before forking
+warmer = WarmUp()
+
+def engine_ready():
+    """Whether the models are loaded, by the warm-up, a request or the prefork master"""
+    # models_loaded is missing while another thread is still importing pipeline
+    models_loaded = getattr(sys.modules.get('pipeline'), 'models_loaded', None)
+    # Loaded but still running the warm-up inferences is not ready yet
+    return models_loaded is not None and models_loaded() and warmer.status != 'running'
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
 
-def process_video(video_path, output_folder):
-    """Process video with ANPR and return paths to results - Memory optimized"""
-    try:
-        # Load cached models
-        coco_model, license_plate_detector = load_models()
-        
-        mot_tracker = Sort()
-        
-        # Load video
-        cap = cv2.VideoCapture(video_path)
-        
-        vehicles = [2, 3, 5, 7]
-        results = {}
-        
-        # Read frames
-        frame_nmr = -1
-        ret = True
-        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        
-        print(f"Processing {total_frames} frames...")
-        
-        # Process in smaller batches to save memory
-        batch_size = 50
-        
-        while ret:
-            frame_nmr += 1
-            ret, frame = cap.read()
-            
-            if frame_nmr % batch_size == 0:
-                print(f"Processing frame {frame_nmr}/{total_frames}")
-                # Force garbage collection every batch
-                gc.collect()
-            
-            if ret:
-                results[frame_nmr] = {}
-                
-                # Detect vehicles
-                detections = coco_model(frame)[0]
-                detections_ = []
-                for detection in detections.boxes.data.tolist():
-                    x1, y1, x2, y2, score, class_id = detection
-                    if int(class_id) in vehicles:
-                        detections_.append([x1, y1, x2, y2, score])
-                
-                # Track vehicles
-                track_ids = mot_tracker.update(np.asarray(detections_))
-                
-                # Detect license plates
-                license_plates = license_plate_detector(frame)[0]
-                for license_plate in license_plates.boxes.data.tolist():
-                    x1, y1, x2, y2, score, class_id = license_plate
-                    
-                    # Assign license plate to car
-                    xcar1, ycar1, xcar2, ycar2, car_id = get_car(license_plate, track_ids)
-                    
-                    if car_id != -1:
-                        # Crop license plate
-                        license_plate_crop = frame[int(y1):int(y2), int(x1): int(x2), :]
-                        
-                        # Process license plate
-                        license_plate_crop_gray = cv2.cvtColor(license_plate_crop, cv2.COLOR_BGR2GRAY)
-                        _, license_plate_crop_thresh = cv2.threshold(license_plate_crop_gray, 64, 255, cv2.THRESH_BINARY_INV)
-                        
-                        # Read license plate number
-                        license_plate_text, license_plate_text_score = read_license_plate(license_plate_crop_thresh)
-                        
-                        if license_plate_text is not None:
-                            results[frame_nmr][car_id] = {
-                                'car': {'bbox': [xcar1, ycar1, xcar2, ycar2]},
-                                'license_plate': {
-                                    'bbox': [x1, y1, x2, y2],
-                                    'text': license_plate_text,
-                                    'bbox_score': score,
-                                    'text_score': license_plate_text_score
-                                }
-                            }
-        
-        cap.release()
-        
-        # Write results to CSV
-        csv_path = os.path.join(output_folder, 'results.csv')
-        write_csv(results, csv_path)
-        
-        print("Generating output video...")
-        # Generate output video directly from raw results
-        output_video = os.path.join(output_folder, 'output.avi')
-        generate_output_video_simple(video_path, csv_path, output_video)
-        
-        return {
-            'csv': csv_path,
-            'video': output_video
-        }
-        
-    except Exception as e:
-        print(f"Error processing video: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        raise e
-
-def generate_output_video_simple(input_video, csv_file, output_video):
-    """Generate visualization video from CSV results"""
-    import ast
-    
-    # Check if CSV exists and has data
-    if not os.path.exists(csv_file):
-        print(f"CSV file not found: {csv_file}")
-        return
-    
-    results = pd.read_csv(csv_file)
-    if len(results) == 0:
-        print("No results found in CSV")
-        return
-        
-    cap = cv2.VideoCapture(input_video)
-    
-    fourcc = cv2.VideoWriter_fourcc(*'XVID')
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    out = cv2.VideoWriter(output_video, fourcc, fps, (width, height))
-    
-    frame_nmr = -1
-    ret = True
-    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    
-    print(f"Rendering {total_frames} frames...")
-    
-    while ret:
-        ret, frame = cap.read()
-        frame_nmr += 1
-        
-        if frame_nmr % 100 == 0:
-            print(f"Rendering frame {frame_nmr}/{total_frames}")
-        
-        if ret:
-            # Get detections for this frame
-            df_ = results[results['frame_nmr'] == frame_nmr]
-            
-            for row_indx in range(len(df_)):
-                try:
-                    # Draw car bounding box
-                    car_bbox = ast.literal_eval(df_.iloc[row_indx]['car_bbox'].replace('[ ', '[').replace('   ', ' ').replace('  ', ' ').replace(' ', ','))
-                    car_x1, car_y1, car_x2, car_y2 = car_bbox
-                    cv2.rectangle(frame, (int(car_x1), int(car_y1)), (int(car_x2), int(car_y2)), (0, 255, 0), 3)
-                    
-                    # Draw license plate bounding box
-                    lp_bbox = ast.literal_eval(df_.iloc[row_indx]['license_plate_bbox'].replace('[ ', '[').replace('   ', ' ').replace('  ', ' ').replace(' ', ','))
-                    x1, y1, x2, y2 = lp_bbox
-                    cv2.rectangle(frame, (int(x1), int(y1)), (int(x2), int(y2)), (0, 0, 255), 2)
-                    
-                    # Add license plate text
-                    license_text = str(df_.iloc[row_indx]['license_number'])
-                    cv2.putText(frame, license_text, (int(car_x1), int(car_y1) - 10),
-                               cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 255, 0), 2)
-                except Exception as e:
-                    print(f"Error processing frame {frame_nmr}, row {row_indx}: {e}")
-                    continue
-            
-            out.write(frame)
-    
-    out.release()
-    cap.release()
-    print("Video rendering complete!")
-    out.release()
-    cap.release()
-    print("Video rendering complete!")
-
 @app.route('/')
 def index():
     return render_template('index.html')
 
+@app.route('/ready')
+def ready():
+    """Readiness probe: 200 once the models are loaded, 503 before"""
+    is_ready = engine_ready()
+    return jsonify({'ready': is_ready, 'warmup': warmer.to_dict()}), 200 if is_ready else 503
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus scrape endpoint: stage latency histograms, job gauges and RSS"""
+    return app.response_class(metrics.render(), mimetype=metrics.CONTENT_TYPE)
+
 @app.route('/upload', methods=['POST'])
 def upload_file():
+    """Save the upload and queue it for processing; returns the job ID immediately"""
     if 'video' not in request.files:
-        flash('No file selected')
-        return redirect(request.url)
+        return jsonify({'error': 'No file selected'}), 400
     
     file = request.files['video']
     
     if file.filename == '':
-        flash('No file selected')
-        return redirect(request.url)
+        return jsonify({'error': 'No file selected'}), 400
     
-    if file and allowed_file(file.filename):
-        filename = secure_filename(file.filename)
-        timestamp = str(int(time.time()))
-        filename = f"{timestamp}_{filename}"
-        
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
-        
-        # Create output folder for this video
-        output_folder = os.path.join(app.config['OUTPUT_FOLDER'], timestamp)
-        os.makedirs(output_folder, exist_ok=True)
-        
-        try:
-            # Process video
-            results = process_video(filepath, output_folder)
-            
-            return render_template('result.html', 
-                                 video_name=filename,
-                                 output_video=os.path.basename(results['video']),
-                                 timestamp=timestamp)
-        except Exception as e:
-            flash(f'Error processing video: {str(e)}')
-            return redirect(url_for('index'))
-    else:
-        flash('Invalid file type. Please upload MP4, AVI, MOV, or MKV files.')
-        return redirect(url_for('index'))
+    if not allowed_file(file.filename):
+        return jsonify({'error': 'Invalid file type. Please upload MP4, AVI, MOV, or MKV files.'}), 400
+    
+    filename = secure_filename(file.filename)
+    # Millisecond resolution: queued uploads can arrive within the same second
+    timestamp = str(int(time.time() * 1000))
+    filename = f"{timestamp}_{filename}"
+    
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    file.save(filepath)
+    
+    # Create output folder for this video
+    output_folder = os.path.join(app.config['OUTPUT_FOLDER'], timestamp)
+    os.makedirs(output_folder, exist_ok=True)
+    
+    # Written before queueing so a restarted process can resume the job
+    job_id = uuid.uuid4().hex
+    meta = {'video_name': filename, 'timestamp': timestamp}
+    # profile=1 records a Chrome trace of this job (ANPR_PROFILE=1 profiles every job)
+    if request.form.get('profile', '').lower() in ('1', 'true', 'yes'):
+        meta['profile'] = True
+    # output=clips writes short clips around each vehicle instead of re-encoding the whole video
+    if request.form.get('output'):
+        from clips import OUTPUT_MODES
+        if request.form['output'] not in OUTPUT_MODES:
+            os.remove(filepath)
+            shutil.rmtree(output_folder, ignore_errors=True)
+            return jsonify({'error': f"output must be one of {', '.join(OUTPUT_MODES)}"}), 400
+        meta['output_mode'] = request.form['output']
+    # Claimed before the job file exists, so no other worker can resume it meanwhile
+    claim = JobClaim.acquire(output_folder)
+    write_job_file(output_folder, job_id, filepath, meta)
+    
+    try:
+        job = jobs.submit(process_video, filepath, output_folder, profile=meta.get('profile'),
+                          output_mode=meta.get('output_mode'), claim=claim, meta=meta, job_id=job_id)
+    except JobQueueFull as e:
+        claim.release()
+        os.remove(filepath)
+        shutil.rmtree(output_folder, ignore_errors=True)
+        return jsonify({'error': str(e)}), 503
+    
+    return jsonify({
+        'job_id': job.id,
+        'status_url': url_for('job_status', job_id=job.id),
+        'result_url': url_for('job_result', job_id=job.id),
+    }), 202
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Report job progress and processing speed"""
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    status = job.to_dict()
+    status['queue'] = jobs.stats()
+    status['memory'] = governor.stats()
+    return jsonify(status)
+
+@app.route('/jobs/<job_id>/result')
+def job_result(job_id):
+    """Result page for browsers, download links as JSON otherwise"""
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    if job.status == 'failed':
+        return jsonify({'error': f'Error processing video: {job.error}', 'status': job.status}), 500
+    if job.status != 'done':
+        return jsonify(job.to_dict()), 409
+    
+    timestamp = job.meta['timestamp']
+    # Jobs run with output=clips have no full video; their clips are listed in clips.json
+    clip_files = []
+    if 'clips' in job.result and os.path.exists(job.result['clips']):
+        with open(job.result['clips']) as f:
+            clip_files = [clip['file'] for clip in json.load(f)['clips']]
+    output_video = os.path.basename(job.result['video']) if 'video' in job.result else None
+    if request.accept_mimetypes.best_match(['application/json', 'text/html']) == 'text/html':
+        return render_template('result.html',
+                               video_name=job.meta['video_name'],
+                               output_video=output_video or (clip_files[0] if clip_files else None),
+                               timestamp=timestamp)
+    links = {
+        'job': job.to_dict(),
+        'csv_url': url_for('download_file', timestamp=timestamp, filename=os.path.basename(job.result['csv'])),
+    }
+    if output_video:
+        links['video_url'] = url_for('serve_video', timestamp=timestamp, filename=output_video)
+        links['download_video_url'] = url_for('download_file', timestamp=timestamp, filename=output_video)
+    if clip_files:
+        links['clip_urls'] = [url_for('serve_video', timestamp=timestamp, filename=name) for name in clip_files]
+    if 'crops' in job.result:
+        links['crops_url'] = url_for('job_crops', job_id=job_id)
+    for key in ('ocr_gate', 'watchlist_hits'):
+        if key in job.result:
+            links[key] = job.result[key]
+    # tracks is missing from jobs finished by older versions; trace and profile_summary
+    # are present when the job was profiled, clips when it was run with output=clips
+    for key in ('tracks', 'clips', 'trace', 'profile_summary'):
+        if key in job.result:
+            links[f'{key}_url'] = url_for('download_file', timestamp=timestamp,
+                                          filename=os.path.basename(job.result[key]))
+    return jsonify(links)
+
+@app.route('/jobs/<job_id>/crops.zip')
+def job_crops(job_id):
+    """Best plate crop of every track and manifest.json, zipped while streaming"""
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    if job.status != 'done':
+        return jsonify(job.to_dict()), 409
+    if not os.path.exists(job.result.get('crops', '')):
+        return jsonify({'error': 'No plate crops for this job'}), 404
+    from plate_gallery import stream_zip
+    return Response(stream_zip(job.result['crops']), mimetype='application/zip', headers={
+        'Content-Disposition': f"attachment; filename=plates_{job.meta['timestamp']}.zip"})
 
 @app.route('/download/<timestamp>/<filename>')
 def download_file(timestamp, filename):
@@ -360,11 +346,136 @@ def download_file(timestamp, filename):
     
     return send_file(filepath, as_attachment=True, download_name=filename)
 
+@app.route('/plates/<text>')
+def plate_sightings(text):
+    """Every sighting of a plate across all processed videos; ?prefix=1 matches plates starting with text"""
+    from plate_store import get_store
+    
+    store = get_store()
+    if store is None:
+        return jsonify({'error': 'Plate store is disabled (ANPR_DB_PATH is empty)'}), 404
+    try:
+        limit = min(int(request.args.get('limit', 100)), 1000)
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    started_at = time.perf_counter()
+    response = {
+        'plate': text,
+        'sightings': store.sightings(text, prefix=request.args.get('prefix') == '1', limit=limit),
+    }
+    if request.args.get('reads') == '1':
+        response['reads'] = store.reads(text, limit=limit)
+    response['query_ms'] = round((time.perf_counter() - started_at) * 1000, 2)
+    return jsonify(response)
+
+@app.route('/api/recognize', methods=['POST'])
+def recognize():
+    """
+    Recognize plates in still images.
+
+    Accepts multipart `images` files or JSON {"images": [<base64>, ...]} and
+    returns vehicle boxes, plate boxes and plate text for each image.
+    """
+    if request.files:
+        blobs = [f.read() for f in request.files.getlist('images')]
+    else:
+        data = request.get_json(silent=True) or {}
+        try:
+            blobs = [base64.b64decode(image) for image in data.get('images', [])]
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Images must be base64 encoded'}), 400
+    
+    if not blobs:
+        return jsonify({'error': 'No images given'}), 400
+    if len(blobs) > app.config['MAX_IMAGES_PER_REQUEST']:
+        return jsonify({'error': f"At most {app.config['MAX_IMAGES_PER_REQUEST']} images per request"}), 413
+    
+    from pipeline import decode_image
+    images = [decode_image(blob) for blob in blobs]
+    del blobs
+    invalid = [i for i, image in enumerate(images) if image is None]
+    if invalid:
+        return jsonify({'error': f'Could not decode images at positions {invalid}'}), 400
+    
+    # One submission per image so they can share a batch with other requests
+    futures = [image_batcher.submit(image) for image in images]
+    try:
+        results = [future.result(timeout=60) for future in futures]
+    except Exception as e:
+        return jsonify({'error': f'Recognition failed: {e}'}), 500
+    return jsonify({'images': results})
+
+@app.route('/streams', methods=['POST'])
+def start_stream():
+    """Start live processing of a camera/RTSP source: {"source": ..., "policy": "latest"}"""
+    if not app.config['ENABLE_STREAMS']:
+        return jsonify({'error': 'Live streams are disabled (set ANPR_ENABLE_STREAMS=1)'}), 404
+    from live import LiveStream, DROP_POLICIES
+    data = request.get_json(silent=True) or request.form
+    source = data.get('source')
+    if not source:
+        return jsonify({'error': 'No source given'}), 400
+    policy = data.get('policy', 'latest')
+    if policy not in DROP_POLICIES:
+        return jsonify({'error': f'Unknown drop policy, expected one of {list(DROP_POLICIES)}'}), 400
+    try:
+        max_queue = int(data.get('max_queue', 4))
+        max_latency_ms = float(data.get('max_latency_ms', 1000))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'max_queue must be an integer and max_latency_ms a number'}), 400
+    
+    for stream_id in [k for k, v in live_streams.items() if not v.running]:
+        del live_streams[stream_id]
+    if len(live_streams) >= app.config['MAX_STREAMS']:
+        return jsonify({'error': 'Too many live streams running'}), 503
+    
+    stream_id = uuid.uuid4().hex[:12]
+    stream = LiveStream(source, drop_policy=policy, max_queue=max_queue, max_latency_ms=max_latency_ms,
+                        stream_id=stream_id)
+    live_streams[stream_id] = stream.start()
+    return jsonify({'stream_id': stream_id, 'status_url': url_for('stream_status', stream_id=stream_id)}), 201
+
+@app.route('/streams/<stream_id>')
+def stream_status(stream_id):
+    """Stream statistics plus plate events newer than ?since=<processed_at>"""
+    stream = live_streams.get(stream_id)
+    if stream is None:
+        return jsonify({'error': 'Unknown stream'}), 404
+    try:
+        since = float(request.args.get('since', 0))
+    except ValueError:
+        return jsonify({'error': 'since must be a timestamp'}), 400
+    status = stream.stats()
+    status['events'] = [event for event in list(stream.events) if event['processed_at'] > since]
+    return jsonify(status)
+
+@app.route('/streams/<stream_id>', methods=['DELETE'])
+def stop_stream(stream_id):
+    stream = live_streams.pop(stream_id, None)
+    if stream is None:
+        return jsonify({'error': 'Unknown stream'}), 404
+    stream.stop()
+    return jsonify(stream.stats())
+
+VIDEO_MIMETYPES = {'.mp4': 'video/mp4', '.avi': 'video/x-msvideo'}
+
 @app.route('/video/<timestamp>/<filename>')
 def serve_video(timestamp, filename):
-    """Serve video for preview with auto-cleanup on close"""
+    """Serve video for preview; honours Range requests so players can start and seek immediately"""
     filepath = os.path.join(app.config['OUTPUT_FOLDER'], timestamp, filename)
-    return send_file(filepath, mimetype='video/x-msvideo')
+    mimetype = VIDEO_MIMETYPES.get(os.path.splitext(filename)[1].lower(), 'application/octet-stream')
+    # conditional=True answers "Range: bytes=..." with 206 Partial Content
+    return send_file(filepath, mimetype=mimetype, conditional=True, etag=True)
+
+# resume_interrupted_jobs needs process_video, so it runs once everything is defined.
+# prefork.py warms the models itself and collects the jobs to resume once, before the
+# first fork, so neither happens here in prefork mode. Under other multi-process
+# servers every worker runs this; JobClaim keeps each job in one of them.
+if not os.environ.get('ANPR_PREFORK'):
+    if app.config['RESUME_JOBS']:
+        resume_interrupted_jobs()
+    if app.config['WARMUP']:
+        warmer.start()
 
 if __name__ == '__main__':
     # Use PORT environment variable for cloud deployment (Render, etc.)
@@ -242,7 +242,7 @@ with col1:
 with col2:
     st.subheader("📊 Statistics")
     if uploaded_file:
-        file_size = len(uploaded_file.getvalue()) / (1024 * 1024)  # MB
+        file_size = uploaded_file.size / (1024 * 1024)  # MB
         st.metric("File Size", f"{file_size:.2f} MB")
         st.metric("File Name", uploaded_file.name)
     else:
@@ -251,12 +251,13 @@ with col2:
 st.markdown("---")
 
 if uploaded_file is not None:
-    # Save uploaded file temporarily
+    # Save uploaded file temporarily, in chunks; processing reads it back from disk
+    uploaded_file.seek(0)
     temp_input = tempfile.NamedTemporaryFile(delete=False, suffix=Path(uploaded_file.name).suffix)
-    temp_input.write(uploaded_file.read())
+    _, upload_peak_rss = util.save_upload(uploaded_file, temp_input)
     temp_input.close()
     
-    st.success(f"✅ File uploaded successfully: **{uploaded_file.name}**")
+    st.success(f"✅ File uploaded successfully: **{uploaded_file.name}** (peak RSS {upload_peak_rss:.0f} MB)")
     
     # Process button
     if st.button("🚀 Process Video", type="primary", use_container_width=True):
@@ -0,0 +1,89 @@
+"""
+Dynamic micro-batching for request/response inference.
+
+Concurrent callers submit single items; a background thread collects them
+for at most max_wait_ms after the first one arrives (or until max_batch
+items are waiting) and runs them through the batch function in one call.
+Under light load a request waits at most one window; under heavy load the
+detectors see full batches.
+"""
+import collections
+import threading
+import time
+from concurrent.futures import Future
+
+
+class MicroBatcher(object):
+    """
+    Coalesce concurrent submissions into batches.
+
+    Args:
+        batch_fn (callable): Takes a list of items, returns a list of results in the same order.
+        max_batch (int): Largest batch passed to batch_fn.
+        max_wait_ms (float): How long the first item of a batch waits for company.
+    """
+
+    def __init__(self, batch_fn, max_batch=8, max_wait_ms=10):
+        self.batch_fn = batch_fn
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait_ms = max_wait_ms
+        self._pending = collections.deque()
+        self._cond = threading.Condition()
+        self._thread = None
+        self.batches = 0
+        self.items = 0
+
+    def submit(self, item):
+        """
+        Queue one item.
+
+        Returns:
+            concurrent.futures.Future: Resolves to the item's result.
+        """
+        future = Future()
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+                self._thread.start()
+            self._pending.append((item, future))
+            self._cond.notify_all()
+        return future
+
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'items': self.items,
+            'avg_batch_size': round(self.items / self.batches, 2) if self.batches else 0.0,
+        }
+
+    def _collect(self):
+        with self._cond:
+            while not self._pending:
+                self._cond.wait()
+            deadline = time.monotonic() + self.max_wait_ms / 1000.0
+            while len(self._pending) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            count = min(self.max_batch, len(self._pending))
+            return [self._pending.popleft() for _ in range(count)]
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            # Skip callers that cancelled while waiting
+            batch = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            items = [item for item, _ in batch]
+            futures = [future for _, future in batch]
+            self.batches += 1
+            self.items += len(items)
+            try:
+                results = self.batch_fn(items)
+                for future, result in zip(futures, results):
+                    future.set_result(result)
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
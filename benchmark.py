@@ -0,0 +1,248 @@
+"""
+End-to-end pipeline benchmark.
+
+Generates a synthetic traffic video (cars as coloured rectangles carrying a
+white plate with rendered text), runs it through process_video and prints
+frames per second, time per pipeline stage and peak memory as JSON.
+
+With the default stub models no weights, GPU or network are needed, and
+results are reproducible: the stub detectors find cars and plates by colour
+thresholding and the stub OCR derives the text from the plate's pixels.
+
+    python benchmark.py --width 1280 --height 720 --frames 300 --cars 6
+    python benchmark.py --models real --ocr real --video traffic.mp4
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+import metrics
+import pipeline
+from memory import RssTracker, peak_rss_mb
+from util import DetectionResult
+
+# BGR colours the stub detectors threshold on
+CAR_COLOUR = (180, 70, 30)
+PLATE_COLOUR = (255, 255, 255)
+ROAD_COLOUR = 90
+
+# COCO class ID for car
+CAR_CLASS = 2
+
+
+def generate_video(path, width=1280, height=720, frames=300, cars=4, fps=25.0, seed=0):
+    """
+    Write a synthetic traffic video.
+
+    Cars drive horizontally in lanes at different speeds and wrap around the
+    frame edges; each carries a plate with UK-style text.
+
+    Args:
+        path (str): Output path; written as MJPG AVI, which every OpenCV build can encode.
+        width (int): Frame width.
+        height (int): Frame height.
+        frames (int): Number of frames.
+        cars (int): Number of cars on screen (traffic density).
+        fps (float): Frame rate.
+        seed (int): Seed for speeds, lanes and plate text.
+
+    Returns:
+        str: The path written.
+    """
+    rng = np.random.RandomState(seed)
+    car_w, car_h = max(40, width // 8), max(24, height // 8)
+    plate_w, plate_h = car_w * 3 // 5, max(10, car_h // 4)
+    lanes = max(1, (height - car_h) // (car_h + 10))
+    letters = 'ABCDEFGHJKLMNPRSTVWXYZ'
+
+    vehicles = []
+    for i in range(cars):
+        text = (letters[rng.randint(len(letters))] + letters[rng.randint(len(letters))] +
+                '%02d' % rng.randint(100) + ''.join(letters[rng.randint(len(letters))] for _ in range(3)))
+        vehicles.append({
+            'x': rng.uniform(0, width),
+            'y': 5 + (i % lanes) * (car_h + 10),
+            'speed': rng.uniform(2, 8) * width / 1280.0 * (1 if i % 2 == 0 else -1),
+            'text': text,
+        })
+
+    # Static noise so the road isn't trivially compressible
+    background = np.full((height, width, 3), ROAD_COLOUR, dtype=np.uint8)
+    background = cv2.add(background, rng.randint(0, 20, (height, width, 3)).astype(np.uint8))
+
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), fps, (width, height))
+    font_scale = plate_h / 30.0
+    for _ in range(frames):
+        frame = background.copy()
+        for vehicle in vehicles:
+            x1, y1 = int(vehicle['x']) % (width + car_w) - car_w, int(vehicle['y'])
+            cv2.rectangle(frame, (x1, y1), (x1 + car_w, y1 + car_h), CAR_COLOUR, -1)
+            px1, py1 = x1 + (car_w - plate_w) // 2, y1 + car_h - plate_h - 3
+            cv2.rectangle(frame, (px1, py1), (px1 + plate_w, py1 + plate_h), PLATE_COLOUR, -1)
+            cv2.putText(frame, vehicle['text'], (px1 + 3, py1 + plate_h - 3), cv2.FONT_HERSHEY_SIMPLEX,
+                        font_scale, (0, 0, 0), max(1, int(font_scale * 2)))
+            vehicle['x'] += vehicle['speed']
+        writer.write(frame)
+    writer.release()
+    return path
+
+
+class StubDetector(object):
+    """
+    Deterministic detector that finds solid regions of one colour.
+
+    Callable like an ultralytics YOLO model and returns util.DetectionResult objects.
+
+    Args:
+        colour (tuple): BGR colour to look for.
+        class_id (int): Class reported for every box.
+        score (float): Confidence reported for every box.
+        tolerance (int): Per-channel colour tolerance.
+        min_area (int): Smallest region, in pixels of the image passed in, reported as a box.
+    """
+
+    def __init__(self, colour, class_id, score, tolerance=12, min_area=30):
+        self.lower = np.array([max(0, c - tolerance) for c in colour], dtype=np.uint8)
+        self.upper = np.array([min(255, c + tolerance) for c in colour], dtype=np.uint8)
+        self.class_id = class_id
+        self.score = score
+        self.min_area = min_area
+        self.overrides = {}
+
+    def _detect(self, image):
+        mask = cv2.inRange(image, self.lower, self.upper)
+        count, _, stats, _ = cv2.connectedComponentsWithStats(mask)
+        rows = []
+        for x, y, w, h, area in stats[1:count]:
+            if area >= self.min_area:
+                rows.append([x, y, x + w, y + h, self.score, self.class_id])
+        return DetectionResult(rows)
+
+    def __call__(self, source, **kwargs):
+        images = source if isinstance(source, list) else [source]
+        return [self._detect(image) for image in images]
+
+
+def stub_ocr(license_plate_crop):
+    """Deterministic stand-in for util.read_license_plate: the same crop always gives the same text"""
+    digest = hashlib.md5(np.ascontiguousarray(license_plate_crop).tobytes()).hexdigest().upper()
+    return 'BM' + str(int(digest[:2], 16) % 100).zfill(2) + ''.join(chr(65 + int(c, 16) % 26) for c in digest[2:5]), 0.9
+
+
+def _stage_totals():
+    return {values[0]: (child.sum, child.count) for values, child in metrics.STAGE_SECONDS._children.items()}
+
+
+def run(video_path, models='stub', ocr='stub', workdir=None):
+    """
+    Run process_video on video_path and measure it.
+
+    Args:
+        video_path (str): Video to process.
+        models (str): 'stub' for StubDetectors or 'real' for the YOLO weights.
+        ocr (str): 'stub' for stub_ocr or 'real' for util.read_license_plate.
+        workdir (str): Folder for the job output; a temporary one is used and removed when None.
+
+    Returns:
+        dict: Benchmark report.
+    """
+    if models == 'stub':
+        pipeline.install_models(StubDetector(CAR_COLOUR, CAR_CLASS, 0.9, min_area=400),
+                                StubDetector(PLATE_COLOUR, 0, 0.8, tolerance=20),
+                                plate_ocr=stub_ocr if ocr == 'stub' else None)
+    else:
+        # Drop stubs a previous run in this process installed, then load the weights
+        if isinstance(pipeline.load_models()[0], StubDetector):
+            pipeline.install_models(None, None)
+        pipeline.install_models(*pipeline.load_models(), plate_ocr=stub_ocr if ocr == 'stub' else None)
+
+    output_folder = workdir or tempfile.mkdtemp(prefix='anpr-bench-')
+    os.makedirs(output_folder, exist_ok=True)
+    rss = RssTracker()
+    progress = {'frames': 0, 'finished_at': None}
+
+    def on_progress(frames_done, total_frames):
+        progress['frames'] = frames_done
+        progress['finished_at'] = time.perf_counter()
+        rss.sample()
+
+    before = _stage_totals()
+    started_at = time.perf_counter()
+    try:
+        # Synthetic reads must not end up next to real sightings in the plate store
+        result = pipeline.process_video(video_path, output_folder, progress_callback=on_progress, store_reads=False)
+        finished_at = time.perf_counter()
+        rows = 0
+        with open(result['csv']) as f:
+            rows = max(0, sum(1 for _ in f) - 1)
+    finally:
+        if workdir is None:
+            shutil.rmtree(output_folder, ignore_errors=True)
+    rss.sample()
+
+    stages = {}
+    for stage, (total, count) in sorted(_stage_totals().items()):
+        total -= before.get(stage, (0.0, 0))[0]
+        count -= before.get(stage, (0.0, 0))[1]
+        if count:
+            stages[stage] = {'total_s': round(total, 4), 'count': count, 'mean_ms': round(total / count * 1000, 3)}
+
+    frames = progress['frames']
+    detect_s = (progress['finished_at'] or finished_at) - started_at
+    return {
+        'video': video_path,
+        'models': models,
+        'ocr': ocr,
+        'frames': frames,
+        'csv_rows': rows,
+        'wall_s': round(finished_at - started_at, 3),
+        'fps': round(frames / (finished_at - started_at), 2) if frames else 0.0,
+        'detect_fps': round(frames / detect_s, 2) if frames and detect_s > 0 else 0.0,
+        'stages': stages,
+        'rss_start_mb': round(rss.start_mb, 1),
+        'rss_peak_mb': round(rss.peak_mb, 1),
+        'process_peak_rss_mb': round(peak_rss_mb(), 1),
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark the ANPR pipeline on a synthetic or given video')
+    parser.add_argument('--video', help='Benchmark this video instead of generating one')
+    parser.add_argument('--width', type=int, default=1280, help='Synthetic video width [1280]')
+    parser.add_argument('--height', type=int, default=720, help='Synthetic video height [720]')
+    parser.add_argument('--frames', type=int, default=300, help='Synthetic video length in frames [300]')
+    parser.add_argument('--cars', type=int, default=4, help='Cars on screen [4]')
+    parser.add_argument('--fps', type=float, default=25.0, help='Synthetic video frame rate [25]')
+    parser.add_argument('--seed', type=int, default=0, help='Synthetic video seed [0]')
+    parser.add_argument('--models', choices=('stub', 'real'), default='stub', help='Detectors to use [stub]')
+    parser.add_argument('--ocr', choices=('stub', 'real'), default='stub', help='Plate OCR to use [stub]')
+    parser.add_argument('--output', help='Also write the JSON report to this file')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    tmpdir = tempfile.mkdtemp(prefix='anpr-bench-video-')
+    try:
+        video_path = args.video
+        if video_path is None:
+            video_path = generate_video(os.path.join(tmpdir, 'synthetic.avi'), args.width, args.height,
+                                        args.frames, args.cars, args.fps, args.seed)
+        report = run(video_path, models=args.models, ocr=args.ocr)
+        if args.video is None:
+            report['video'] = {'width': args.width, 'height': args.height, 'frames': args.frames,
+                               'cars': args.cars, 'fps': args.fps, 'seed': args.seed}
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
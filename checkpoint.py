@@ -0,0 +1,200 @@
+"""
+Periodic checkpoints for resumable video processing.
+
+A checkpoint is two files in the job's output folder:
+
+- checkpoint.pkl: the last processed frame, the pickled Sort tracker, the
+  other per-video state (quality gate, plate consensus, watchlist alerts) and
+  the byte length of the results log that belongs to it. Replaced atomically.
+- checkpoint_results.pkl: an append-only log of pickled result chunks, so each
+  checkpoint only writes the frames processed since the previous one.
+
+If the process dies between the two writes the results log may hold a chunk
+that the state file does not cover yet; load() ignores anything past the
+recorded length.
+"""
+import json
+import os
+import pickle
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: no flock, claims always succeed (single-process only)
+    fcntl = None
+
+STATE_NAME = 'checkpoint.pkl'
+RESULTS_NAME = 'checkpoint_results.pkl'
+JOB_NAME = 'job.json'
+LOCK_NAME = 'job.lock'
+
+
+class Checkpointer(object):
+    """
+    Save and restore pipeline state for one output folder.
+
+    Args:
+        folder (str): Job output folder the checkpoint files live in.
+        every (int): Frames between checkpoints. 0 disables checkpointing.
+    """
+
+    def __init__(self, folder, every=250):
+        self.folder = folder
+        self.every = int(every)
+        self.state_path = os.path.join(folder, STATE_NAME)
+        self.results_path = os.path.join(folder, RESULTS_NAME)
+        self._pending = {}
+        self._results_size = 0
+
+    @property
+    def enabled(self):
+        return self.every > 0
+
+    def load(self):
+        """
+        Returns:
+            dict: {'frame_nmr', 'tracker', 'results', 'state'} from the last checkpoint, or None.
+                state is the dict given to save(); empty for checkpoints written without one.
+        """
+        if not self.enabled or not os.path.exists(self.state_path):
+            return None
+        try:
+            with open(self.state_path, 'rb') as f:
+                state = pickle.load(f)
+            results = {}
+            with open(self.results_path, 'rb') as f:
+                while f.tell() < state['results_size']:
+                    results.update(pickle.load(f))
+        except Exception as e:
+            print(f"Ignoring unreadable checkpoint in {self.folder}: {e}")
+            return None
+
+        # Drop any chunk appended after the state file was last replaced
+        with open(self.results_path, 'r+b') as f:
+            f.truncate(state['results_size'])
+        self._results_size = state['results_size']
+        print(f"Resuming from checkpoint at frame {state['frame_nmr']}")
+        return {'frame_nmr': state['frame_nmr'], 'tracker': state['tracker'], 'results': results,
+                'state': state.get('state') or {}}
+
+    def add(self, frame_nmr, frame_results):
+        """Record a processed frame's results for the next checkpoint"""
+        self._pending[frame_nmr] = frame_results
+
+    def due(self, frame_nmr):
+        """Whether frame_nmr falls on the configured interval"""
+        return self.enabled and (frame_nmr + 1) % self.every == 0
+
+    def maybe_save(self, frame_nmr, tracker, state=None):
+        """Write a checkpoint if frame_nmr falls on the configured interval"""
+        if self.due(frame_nmr):
+            self.save(frame_nmr, tracker, state)
+
+    def save(self, frame_nmr, tracker, state=None):
+        """
+        Args:
+            frame_nmr (int): Last processed frame.
+            tracker (Sort): Tracker after that frame.
+            state (dict): Other picklable per-video state to restore with the tracker.
+        """
+        with open(self.results_path, 'ab') as f:
+            if self._pending:
+                pickle.dump(self._pending, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+            self._results_size = f.tell()
+        self._pending = {}
+
+        tmp_path = self.state_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump({'frame_nmr': frame_nmr, 'tracker': tracker, 'state': state,
+                         'results_size': self._results_size}, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.state_path)
+
+    def clear(self):
+        """Remove checkpoint files and the job file once the job has finished"""
+        job_path = os.path.join(self.folder, JOB_NAME)
+        for path in (self.state_path, self.results_path, self.state_path + '.tmp', job_path):
+            if os.path.exists(path):
+                os.remove(path)
+        self._pending = {}
+        self._results_size = 0
+
+
+def write_job_file(folder, job_id, video_path, meta):
+    """Record what is needed to restart a job after the process is recycled"""
+    with open(os.path.join(folder, JOB_NAME), 'w') as f:
+        json.dump({'job_id': job_id, 'video_path': video_path, 'meta': meta}, f)
+
+
+class JobClaim(object):
+    """
+    Exclusive claim of a job's output folder by this process.
+
+    An flock on job.lock, taken when the job is queued and held until it
+    finishes. Another process (a second worker, a restarted one) can't claim
+    a job that is queued or running elsewhere, so it is never run twice. The
+    kernel drops the lock when its process dies, which is what makes an
+    interrupted job resumable again.
+    """
+
+    def __init__(self, folder, fd):
+        self.path = os.path.join(folder, LOCK_NAME)
+        self._fd = fd
+
+    @classmethod
+    def acquire(cls, folder):
+        """Claim the job in folder, or return None if another process holds it"""
+        fd = os.open(os.path.join(folder, LOCK_NAME), os.O_RDWR | os.O_CREAT, 0o644)
+        if fcntl is not None:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                os.close(fd)
+                return None
+        # The holder's pid, for whoever looks at a stuck job
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        return cls(folder, fd)
+
+    def release(self):
+        """Drop the claim once the job has finished or failed"""
+        if self._fd is None:
+            return
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        os.close(self._fd)
+        self._fd = None
+
+
+def find_resumable_jobs(output_root):
+    """
+    Find unfinished jobs under output_root that can be restarted.
+
+    Jobs that died before their first checkpoint are included too; they start
+    again from frame 0 instead of forcing a re-upload. Jobs another process
+    has claimed may be listed; claim each one with JobClaim.acquire before
+    running it.
+
+    Returns:
+        list: (output_folder, job_info) pairs for folders that still have a job file.
+    """
+    resumable = []
+    if not os.path.isdir(output_root):
+        return resumable
+    for name in sorted(os.listdir(output_root)):
+        folder = os.path.join(output_root, name)
+        job_path = os.path.join(folder, JOB_NAME)
+        if not os.path.exists(job_path):
+            continue
+        try:
+            with open(job_path) as f:
+                info = json.load(f)
+        except Exception as e:
+            print(f"Skipping unreadable job file {job_path}: {e}")
+            continue
+        if os.path.exists(info.get('video_path', '')):
+            resumable.append((folder, info))
+    return resumable
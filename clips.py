@@ -0,0 +1,129 @@
+"""
+Event-clip output.
+
+Instead of re-encoding the whole input, write one short annotated clip per
+stretch of activity: each track's lifetime widened by a pre and post roll,
+with overlapping stretches merged. Only the frames inside a clip are
+decoded (FrameSource seeks to the clip start) and encoded, so a long video
+with a few seconds of traffic costs a few seconds of encoding. clips.json
+indexes the clips with their frame range, time range and plates.
+
+Select it per upload with the form field `output=clips`, or for every job
+with ANPR_OUTPUT_MODE=clips; `both` writes the full video as well.
+"""
+import json
+import os
+import time
+
+import cv2
+
+import metrics
+import profiling
+from video_source import FrameSource
+from video_writer import open_video_writer, output_extension
+
+OUTPUT_MODES = ('video', 'clips', 'both')
+OUTPUT_MODE = os.environ.get('ANPR_OUTPUT_MODE', 'video')
+PRE_ROLL_SECONDS = float(os.environ.get('ANPR_CLIP_PRE_ROLL', 2.0))
+POST_ROLL_SECONDS = float(os.environ.get('ANPR_CLIP_POST_ROLL', 2.0))
+INDEX_NAME = 'clips.json'
+
+
+def clip_intervals(tracks, pre_roll, post_roll, total_frames=None):
+    """
+    Frame ranges to write, one per stretch of activity.
+
+    Args:
+        tracks (list): track_summary.TrackSummary.rows().
+        pre_roll (int): Frames kept before a track's first frame.
+        post_roll (int): Frames kept after a track's last frame.
+        total_frames (int): Frames in the video, to clamp the last range; None to not clamp.
+
+    Returns:
+        list: [start, end) frame ranges with the tracks they cover, as
+            {'start_frame', 'end_frame', 'tracks'} dicts in order.
+    """
+    intervals = []
+    for track in sorted(tracks, key=lambda track: track['first_frame']):
+        start = max(0, track['first_frame'] - pre_roll)
+        end = track['last_frame'] + 1 + post_roll
+        if total_frames:
+            end = min(end, total_frames)
+        # Overlapping or touching ranges become one clip
+        if intervals and start <= intervals[-1]['end_frame']:
+            intervals[-1]['end_frame'] = max(intervals[-1]['end_frame'], end)
+            intervals[-1]['tracks'].append(track)
+        else:
+            intervals.append({'start_frame': start, 'end_frame': end, 'tracks': [track]})
+    return intervals
+
+
+def annotate(frame, frame_results):
+    """Draw car boxes, plate boxes and plate text the way the full output video does"""
+    for result in frame_results.values():
+        car_x1, car_y1, car_x2, car_y2 = result['car']['bbox']
+        cv2.rectangle(frame, (int(car_x1), int(car_y1)), (int(car_x2), int(car_y2)), (0, 255, 0), 3)
+        x1, y1, x2, y2 = result['license_plate']['bbox']
+        cv2.rectangle(frame, (int(x1), int(y1)), (int(x2), int(y2)), (0, 0, 255), 2)
+        cv2.putText(frame, str(result['license_plate']['text']), (int(car_x1), int(car_y1) - 10),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 255, 0), 2)
+    return frame
+
+
+def write_clips(video_path, results, tracks, output_folder, pre_roll_seconds=PRE_ROLL_SECONDS,
+                post_roll_seconds=POST_ROLL_SECONDS):
+    """
+    Write annotated clips around every track and their index.
+
+    Args:
+        video_path (str): Source video.
+        results (dict): {frame_nmr: {car_id: {...}}} as written to results.csv.
+        tracks (list): track_summary.TrackSummary.rows() for the same video.
+        output_folder (str): Folder for clip_NNN files and clips.json.
+        pre_roll_seconds (float): Video kept before each track appears.
+        post_roll_seconds (float): Video kept after each track disappears.
+
+    Returns:
+        str: Path of clips.json.
+    """
+    # Only the header is read here; each clip opens its own seeking FrameSource
+    probe = FrameSource(video_path)
+    fps = probe.fps if probe.fps and probe.fps > 0 else 25.0
+    total_frames, size = probe.total_frames, (probe.width, probe.height)
+    probe.close()
+
+    intervals = clip_intervals(tracks, int(round(pre_roll_seconds * fps)), int(round(post_roll_seconds * fps)),
+                               total_frames)
+    print(f"Writing {len(intervals)} event clips...")
+    index = []
+    for number, interval in enumerate(intervals):
+        name = f'clip_{number:03d}{output_extension()}'
+        writer = open_video_writer(os.path.join(output_folder, name), fps, size)
+        frames = 0
+        # detect_size=0: clips need the full-resolution frame only
+        with FrameSource(video_path, detect_size=0, start_frame=interval['start_frame'],
+                         end_frame=interval['end_frame']) as source:
+            for frame_ in source:
+                render_started_at = time.perf_counter()
+                writer.write(annotate(frame_.image, results.get(frame_.index, {})))
+                frames += 1
+                render_finished_at = time.perf_counter()
+                metrics.RENDER.observe(render_finished_at - render_started_at)
+                profiling.record('render_frame', render_started_at, render_finished_at, frame=frame_.index)
+        writer.release()
+        index.append({
+            'file': name,
+            'start_frame': interval['start_frame'],
+            'end_frame': interval['start_frame'] + frames,
+            'start_s': round(interval['start_frame'] / fps, 3),
+            'end_s': round((interval['start_frame'] + frames) / fps, 3),
+            'tracks': [{'car_id': track['car_id'], 'license_number': track['license_number'],
+                        'first_frame': track['first_frame'], 'last_frame': track['last_frame']}
+                       for track in interval['tracks']],
+        })
+
+    index_path = os.path.join(output_folder, INDEX_NAME)
+    with open(index_path, 'w') as f:
+        json.dump({'video': os.path.basename(video_path), 'fps': fps, 'total_frames': total_frames,
+                   'pre_roll_s': pre_roll_seconds, 'post_roll_s': post_roll_seconds, 'clips': index}, f, indent=2)
+    return index_path
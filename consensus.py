@@ -0,0 +1,217 @@
+"""
+Per-track plate text consensus.
+
+Each OCR reading of a track votes for one character per plate position,
+weighted by its text_score. The running best string is the top-voted
+character at every position, so a track reports one stable plate instead of
+flickering between readings. Once enough readings agree the consensus is
+decisive and the pipeline stops running OCR for that track.
+
+Every track holds a fixed (length, 37) vote array, where length is that of
+the longest active plate format (plate_formats.py). Shorter readings are
+padded with a blank symbol, so plates of different formats share the array
+and the plate length is voted on like any character. Adding a reading
+touches one cell per position and updates the per-position leaders in place.
+"""
+import string
+
+import numpy as np
+
+import metrics
+from plate_formats import get_matcher
+
+ALPHABET = string.ascii_uppercase + string.digits
+# Vote index of the blank that pads readings shorter than the vote array
+PAD = len(ALPHABET)
+_INDEX = {char: i for i, char in enumerate(ALPHABET)}
+_SKIPPED_DECIDED = metrics.OCR_SKIPPED.labels('decided')
+
+
+def plate_length():
+    """Length of the longest active plate format"""
+    return max(get_matcher().lengths)
+
+
+class PlateVotes(object):
+    """
+    Weighted character votes of one track.
+
+    Args:
+        min_readings (int): Readings needed before the consensus can be decisive.
+        min_agreement (float): Share of the vote weight the leading character needs
+            at every position for the consensus to be decisive.
+        length (int): Longest reading counted; None for plate_length().
+    """
+    __slots__ = ('votes', 'leaders', 'positions', 'weight', 'readings', 'text', 'min_readings', 'min_agreement',
+                 'seen')
+
+    def __init__(self, min_readings=3, min_agreement=0.75, length=None):
+        length = length or plate_length()
+        self.votes = np.zeros((length, len(ALPHABET) + 1), dtype=np.float32)
+        self.leaders = np.zeros(length, dtype=np.intp)
+        self.positions = np.arange(length)
+        self.weight = 0.0
+        self.readings = 0
+        self.text = None
+        self.min_readings = min_readings
+        self.min_agreement = min_agreement
+        self.seen = 0
+
+    def add(self, text, score):
+        """
+        Vote with one reading; empty readings, readings longer than the vote array
+        and readings with characters outside ALPHABET are ignored.
+
+        Returns:
+            bool: Whether the reading was counted.
+        """
+        if not text or len(text) > len(self.positions):
+            return False
+        chars = np.full(len(self.positions), PAD, dtype=np.intp)
+        try:
+            chars[:len(text)] = [_INDEX[char] for char in text]
+        except KeyError:
+            return False
+        score = max(float(score or 0.0), 1e-3)
+        self.votes[self.positions, chars] += score
+        self.weight += score
+        self.readings += 1
+        overtaken = self.votes[self.positions, chars] > self.votes[self.positions, self.leaders]
+        if self.text is None or overtaken.any():
+            self.leaders[overtaken] = chars[overtaken]
+            self.text = ''.join(ALPHABET[i] for i in self.leaders if i != PAD)
+        return True
+
+    def score(self):
+        """Mean vote weight behind the leading characters, per reading: 0..1 like text_score"""
+        if not self.readings:
+            return 0.0
+        return float(self.votes[self.positions, self.leaders].sum()) / (len(self.positions) * self.readings)
+
+    def agreement(self):
+        """Smallest share of the vote weight held by a position's leading character"""
+        if not self.weight:
+            return 0.0
+        return float(self.votes[self.positions, self.leaders].min()) / self.weight
+
+    @property
+    def decisive(self):
+        return self.readings >= self.min_readings and self.agreement() >= self.min_agreement
+
+
+class TrackConsensus(object):
+    """
+    PlateVotes for every track of one video or stream.
+
+    Args:
+        min_readings (int): See PlateVotes.
+        min_agreement (float): See PlateVotes.
+        max_idle (int): Frames after which a track that wasn't seen is dropped.
+        keep_final (bool): Keep dropped tracks' final readings for finalize(). Off for
+            live streams, which never end.
+        length (int): See PlateVotes.
+    """
+
+    def __init__(self, min_readings=3, min_agreement=0.75, max_idle=30, keep_final=True, length=None):
+        self.length = length or plate_length()
+        self.min_readings = min_readings
+        self.min_agreement = min_agreement
+        self.max_idle = max_idle
+        self.keep_final = keep_final
+        self._tracks = {}
+        self._final = {}
+        self.readings = 0
+        self.decided = 0
+        self.carried_forward = 0
+
+    def _votes(self, car_id, frame_nmr):
+        votes = self._tracks.get(car_id)
+        if votes is None:
+            votes = self._tracks[car_id] = PlateVotes(self.min_readings, self.min_agreement, self.length)
+        votes.seen = frame_nmr
+        return votes
+
+    def decisive(self, car_id, frame_nmr):
+        """Whether the track's consensus is settled, so OCR can be skipped"""
+        decisive = self._votes(car_id, frame_nmr).decisive
+        if decisive:
+            self.decided += 1
+            _SKIPPED_DECIDED.inc()
+        return decisive
+
+    def add(self, car_id, frame_nmr, text, score):
+        """
+        Vote with an OCR reading and return the track's consensus.
+
+        Returns:
+            tuple: (text, score) of the consensus, or (None, None) if the track has no valid reading yet.
+        """
+        votes = self._votes(car_id, frame_nmr)
+        if votes.add(text, score):
+            self.readings += 1
+        if votes.text is None:
+            return None, None
+        return votes.text, votes.score()
+
+    def reading(self, car_id, frame_nmr):
+        """The track's consensus for a frame where OCR didn't run"""
+        votes = self._votes(car_id, frame_nmr)
+        if votes.text is None:
+            return None, None
+        self.carried_forward += 1
+        return votes.text, votes.score()
+
+    def end_frame(self, frame_nmr):
+        """Drop tracks that haven't had a plate for max_idle frames"""
+        if frame_nmr % self.max_idle == 0:
+            for car_id in [car_id for car_id, votes in self._tracks.items() if frame_nmr - votes.seen > self.max_idle]:
+                self._retire(car_id)
+
+    def _retire(self, car_id):
+        votes = self._tracks.pop(car_id)
+        if self.keep_final and votes.text is not None:
+            self._final[car_id] = (votes.text, votes.score())
+
+    def rebuild(self, results):
+        """
+        Vote again with the OCR reads in results, for checkpoints that didn't save this object.
+
+        Rows without ocr_text (results from before it was recorded) vote with their text.
+
+        Args:
+            results (dict): {frame_nmr: {car_id: {...}}} restored from a checkpoint.
+        """
+        for frame_nmr in sorted(results):
+            for car_id, result in results[frame_nmr].items():
+                plate = result['license_plate']
+                text, score = plate.get('ocr_text', plate['text']), plate.get('ocr_score', plate['text_score'])
+                if text is not None:
+                    self.add(car_id, frame_nmr, text, score)
+            self.end_frame(frame_nmr)
+
+    def finalize(self, results):
+        """
+        Rewrite every row of results with its track's final consensus.
+
+        Args:
+            results (dict): {frame_nmr: {car_id: {...}}} as built by process_video; changed in place.
+
+        Returns:
+            dict: {car_id: (text, score)} final reading of every track.
+        """
+        for car_id in list(self._tracks):
+            self._retire(car_id)
+        for frame_results in results.values():
+            for car_id, result in frame_results.items():
+                final = self._final.get(car_id)
+                if final is not None and 'license_plate' in result:
+                    result['license_plate']['text'], result['license_plate']['text_score'] = final
+        return dict(self._final)
+
+    def stats(self):
+        return {
+            'tracks': len(self._tracks) + len(self._final),
+            'readings': self.readings,
+            'ocr_skipped_decided': self.decided,
+            'carried_forward': self.carried_forward,
+        }
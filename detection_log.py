@@ -0,0 +1,238 @@
+"""
+Record and replay raw detector output.
+
+Recording wraps both detectors and stores every frame's vehicle and plate
+rows in one compressed .npz file. Replaying feeds those rows back in place
+of the YOLO models, so tracking, plate assignment, OCR and rendering can be
+profiled and regression-tested without the weights:
+
+    python detection_log.py record video.mp4 --output run1         # writes run1/detections.npz
+    python detection_log.py replay video.mp4 run1/detections.npz --output run2
+    python detection_log.py track run1/detections.npz              # tracking + assignment only
+
+Layout of the file: per detector kind, an (N, 6) float32 array of
+[x1, y1, x2, y2, score, class_id] rows for all frames, and an offsets array
+where frame i's rows are rows[offsets[i]:offsets[i + 1]]. Boxes are in the
+coordinates of the image the detector saw, whose (height, width) is stored
+per frame so replay can rescale to a different detection size.
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from util import DetectionResult
+
+LOG_NAME = 'detections.npz'
+KINDS = ('vehicle', 'plate')
+
+
+class _RecordingModel(object):
+    """Pass calls through to a detector and record its rows"""
+
+    def __init__(self, model, recorder, kind):
+        self.model = model
+        self.recorder = recorder
+        self.kind = kind
+        self.overrides = getattr(model, 'overrides', {})
+
+    def __call__(self, source, **kwargs):
+        results = self.model(source, **kwargs)
+        images = source if isinstance(source, list) else [source]
+        for image, result in zip(images, results):
+            self.recorder.add(self.kind, image.shape[:2], result.boxes.data.tolist())
+        return results
+
+
+class DetectionRecorder(object):
+    """
+    Collect the rows both detectors return, frame by frame.
+
+    Args:
+        frame_size (tuple): (width, height) of the full-resolution video.
+        video (str): Source video name stored with the log.
+    """
+
+    def __init__(self, frame_size=None, video=None):
+        self.frame_size = frame_size
+        self.video = video
+        self._frame = None
+        self._frames = []
+        self._shapes = []
+        self._rows = {kind: [] for kind in KINDS}
+
+    def wrap(self, coco_model, license_plate_detector):
+        """Recording versions of the vehicle and plate detectors"""
+        return _RecordingModel(coco_model, self, 'vehicle'), _RecordingModel(license_plate_detector, self, 'plate')
+
+    def begin_frame(self, frame_nmr):
+        """Start collecting rows for frame_nmr; call before running the detectors on it"""
+        self._frame = frame_nmr
+        self._frames.append(frame_nmr)
+        self._shapes.append((0, 0))
+        for kind in KINDS:
+            self._rows[kind].append([])
+
+    def add(self, kind, image_shape, rows):
+        if self._frame is None:
+            raise RuntimeError('begin_frame() must be called before the detectors run')
+        self._shapes[-1] = tuple(image_shape)
+        self._rows[kind][-1].extend(rows)
+
+    def save(self, path):
+        """Write the log to path (.npz) and return the path"""
+        arrays = {
+            'frames': np.asarray(self._frames, dtype=np.int64),
+            'input_shape': np.asarray(self._shapes, dtype=np.int32).reshape(-1, 2),
+            'meta': np.asarray(json.dumps({'frame_size': self.frame_size, 'video': self.video})),
+        }
+        for kind in KINDS:
+            per_frame = self._rows[kind]
+            counts = np.fromiter((len(rows) for rows in per_frame), dtype=np.int64, count=len(per_frame))
+            arrays[f'{kind}_offsets'] = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+            flat = [row for rows in per_frame for row in rows]
+            arrays[f'{kind}_rows'] = np.asarray(flat, dtype=np.float32).reshape(-1, 6)
+        np.savez_compressed(path, **arrays)
+        return path
+
+
+class _ReplayModel(object):
+    """Return recorded rows for the log's current frame, scaled to the image passed in"""
+
+    def __init__(self, log, kind):
+        self.log = log
+        self.kind = kind
+        self.overrides = {}
+
+    def __call__(self, source, **kwargs):
+        images = source if isinstance(source, list) else [source]
+        return [DetectionResult(self.log.rows(self.kind, self.log.frame, image.shape[:2])) for image in images]
+
+
+class DetectionLog(object):
+    """
+    A recorded log, replayed frame by frame.
+
+    Args:
+        path (str): .npz file written by DetectionRecorder.save().
+    """
+
+    def __init__(self, path):
+        with np.load(path) as data:
+            self.frames = data['frames']
+            self.input_shape = data['input_shape']
+            meta = json.loads(str(data['meta']))
+            self._offsets = {kind: data[f'{kind}_offsets'] for kind in KINDS}
+            self._rows = {kind: data[f'{kind}_rows'] for kind in KINDS}
+        self.frame_size = meta.get('frame_size')
+        self.video = meta.get('video')
+        self._position = {int(frame): i for i, frame in enumerate(self.frames)}
+        self.frame = None
+
+    def __len__(self):
+        return len(self.frames)
+
+    def models(self):
+        """Replay stand-ins for the vehicle and plate detectors"""
+        return _ReplayModel(self, 'vehicle'), _ReplayModel(self, 'plate')
+
+    def begin_frame(self, frame_nmr):
+        """Select the frame the replay models answer for"""
+        self.frame = frame_nmr
+
+    def rows(self, kind, frame_nmr, image_shape=None):
+        """
+        Recorded rows of one detector for one frame.
+
+        Args:
+            kind (str): 'vehicle' or 'plate'.
+            frame_nmr (int): Frame number.
+            image_shape (tuple): (height, width) to rescale the boxes to, or None to keep them.
+
+        Returns:
+            numpy.ndarray: (N, 6) float32 rows; empty for frames that weren't recorded.
+        """
+        i = self._position.get(frame_nmr)
+        if i is None:
+            return np.zeros((0, 6), dtype=np.float32)
+        offsets = self._offsets[kind]
+        rows = self._rows[kind][offsets[i]:offsets[i + 1]]
+        recorded_h, recorded_w = self.input_shape[i]
+        if image_shape is None or (tuple(image_shape) == (recorded_h, recorded_w)) or not recorded_w:
+            return rows
+        rows = rows.copy()
+        rows[:, [0, 2]] *= image_shape[1] / float(recorded_w)
+        rows[:, [1, 3]] *= image_shape[0] / float(recorded_h)
+        return rows
+
+
+def replay_tracking(log):
+    """
+    Run tracking and plate-to-vehicle assignment over a log without decoding any video.
+
+    Args:
+        log (DetectionLog): Recorded detections.
+
+    Returns:
+        dict: Frames, assigned plates, tracks and throughput.
+    """
+    from pipeline import VEHICLES
+    from sort.sort import Sort
+    from util import get_car
+
+    tracker = Sort()
+    assigned = 0
+    track_ids_seen = set()
+    started_at = time.perf_counter()
+    for frame_nmr in log.frames:
+        frame_nmr = int(frame_nmr)
+        vehicles = log.rows('vehicle', frame_nmr)
+        vehicles = vehicles[np.isin(vehicles[:, 5].astype(int), VEHICLES), :5]
+        track_ids = tracker.update(vehicles)
+        track_ids_seen.update(int(track[4]) for track in track_ids)
+        for plate in log.rows('plate', frame_nmr).tolist():
+            if get_car(plate, track_ids)[4] != -1:
+                assigned += 1
+    elapsed = time.perf_counter() - started_at
+    return {
+        'frames': len(log),
+        'plates_assigned': assigned,
+        'tracks': len(track_ids_seen),
+        'seconds': round(elapsed, 4),
+        'fps': round(len(log) / elapsed, 1) if elapsed > 0 else 0.0,
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Record and replay raw detector output')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+    record = commands.add_parser('record', help='Process a video and record detections')
+    record.add_argument('video')
+    record.add_argument('--output', default='record_run', help='Output folder [record_run]')
+    replay = commands.add_parser('replay', help='Process a video with recorded detections instead of the models')
+    replay.add_argument('video')
+    replay.add_argument('log', help='detections.npz written by record')
+    replay.add_argument('--output', default='replay_run', help='Output folder [replay_run]')
+    track = commands.add_parser('track', help='Run tracking and plate assignment over a log, no video needed')
+    track.add_argument('log', help='detections.npz written by record')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    if args.command == 'track':
+        print(json.dumps(replay_tracking(DetectionLog(args.log)), indent=2))
+    else:
+        from pipeline import process_video
+
+        os.makedirs(args.output, exist_ok=True)
+        started_at = time.perf_counter()
+        if args.command == 'record':
+            result = process_video(args.video, args.output, record_detections=os.path.join(args.output, LOG_NAME))
+        else:
+            result = process_video(args.video, args.output, replay_detections=args.log)
+        result['seconds'] = round(time.perf_counter() - started_at, 3)
+        print(json.dumps(result, indent=2))
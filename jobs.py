@@ -0,0 +1,219 @@
+"""
+Background job queue for video processing.
+
+Uploads are turned into jobs that a small pool of worker threads executes, so
+an HTTP request never blocks for the length of a video. Workers run in the web
+process and share its cached models.
+
+With a state_dir, job status is also written to disk so any process of a
+multi-worker deployment can answer status queries for any job.
+"""
+import json
+import os
+import queue
+import threading
+import time
+import traceback
+import uuid
+
+
+class JobQueueFull(Exception):
+    """Raised when a job is submitted while the queue is at capacity"""
+
+
+class Job(object):
+    """State of a single processing job"""
+
+    def __init__(self, job_id, meta=None):
+        self.id = job_id
+        self.meta = meta or {}
+        self.status = 'queued'
+        self.frames_done = 0
+        self.total_frames = 0
+        # Frames already done before this run started (resumed jobs)
+        self._frames_at_start = None
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def progress(self):
+        if self.status == 'done':
+            return 1.0
+        if not self.total_frames:
+            return 0.0
+        return min(1.0, self.frames_done / float(self.total_frames))
+
+    @property
+    def fps(self):
+        if hasattr(self, '_saved_fps'):
+            return self._saved_fps
+        if self.started_at is None or self._frames_at_start is None:
+            return 0.0
+        elapsed = (self.finished_at or time.time()) - self.started_at
+        frames = self.frames_done - self._frames_at_start
+        return frames / elapsed if elapsed > 0 else 0.0
+
+    def update_progress(self, frames_done, total_frames):
+        """Progress callback handed to the processing function"""
+        if self._frames_at_start is None:
+            self._frames_at_start = frames_done - 1
+        self.frames_done = frames_done
+        self.total_frames = total_frames
+
+    @classmethod
+    def from_state(cls, state):
+        """Rebuild a read-only snapshot of a job saved by another process"""
+        job = cls(state['status']['id'], state.get('meta'))
+        job.result = state.get('result')
+        for key in ('status', 'frames_done', 'total_frames', 'error', 'created_at', 'started_at', 'finished_at'):
+            setattr(job, key, state['status'][key])
+        job._saved_fps = state['status']['fps']
+        return job
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'status': self.status,
+            'progress': round(self.progress, 4),
+            'frames_done': self.frames_done,
+            'total_frames': self.total_frames,
+            'fps': round(self.fps, 2),
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'error': self.error,
+        }
+
+
+class JobManager(object):
+    """
+    Bounded job queue served by a pool of worker threads.
+
+    Args:
+        max_workers (int): Number of jobs processed concurrently.
+        max_queue (int): Number of jobs allowed to wait for a worker.
+        max_finished (int): Finished jobs kept for status queries before the oldest are dropped.
+        state_dir (str): Folder for per-job status files shared between processes, or None.
+        save_interval (float): Minimum seconds between progress writes to state_dir.
+    """
+
+    def __init__(self, max_workers=1, max_queue=4, max_finished=100, state_dir=None, save_interval=1.0):
+        self.max_workers = max(1, int(max_workers))
+        self.max_queue = max(1, int(max_queue))
+        self.max_finished = max_finished
+        self.state_dir = state_dir
+        self.save_interval = save_interval
+        if state_dir:
+            os.makedirs(state_dir, exist_ok=True)
+        self._queue = queue.Queue(maxsize=self.max_queue)
+        self._jobs = {}
+        self._finished = []
+        self._lock = threading.Lock()
+        self._workers = []
+
+    def _ensure_workers(self):
+        if self._workers:
+            return
+        for i in range(self.max_workers):
+            worker = threading.Thread(target=self._worker, name=f'job-worker-{i}', daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def submit(self, fn, *args, meta=None, job_id=None, **kwargs):
+        """
+        Queue fn(*args, progress_callback=..., **kwargs) for execution.
+
+        Returns:
+            Job: The queued job.
+
+        Raises:
+            JobQueueFull: If max_queue jobs are already waiting.
+        """
+        job = Job(job_id or uuid.uuid4().hex, meta)
+        with self._lock:
+            self._ensure_workers()
+            try:
+                self._queue.put_nowait((job, fn, args, kwargs))
+            except queue.Full:
+                raise JobQueueFull(f'Job queue is full ({self.max_queue} waiting)')
+            self._jobs[job.id] = job
+        self._save(job, force=True)
+        return job
+
+    def get(self, job_id):
+        """Look up a job, falling back to status saved by other processes"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None and self.state_dir:
+            try:
+                with open(self._state_path(job_id)) as f:
+                    job = Job.from_state(json.load(f))
+            except (OSError, ValueError, KeyError):
+                return None
+        return job
+
+    def _state_path(self, job_id):
+        # Job IDs come from URLs; keep them inside state_dir
+        return os.path.join(self.state_dir, os.path.basename(job_id) + '.json')
+
+    def _save(self, job, force=False):
+        if not self.state_dir:
+            return
+        now = time.time()
+        if not force and now - getattr(job, '_saved_at', 0) < self.save_interval:
+            return
+        job._saved_at = now
+        state = {'status': job.to_dict(), 'meta': job.meta, 'result': job.result}
+        path = self._state_path(job.id)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        try:
+            os.makedirs(self.state_dir, exist_ok=True)
+            with open(tmp_path, 'w') as f:
+                json.dump(state, f)
+            os.replace(tmp_path, path)
+        except (OSError, TypeError, ValueError) as e:
+            print(f"Could not save state of job {job.id}: {e}")
+
+    def stats(self):
+        with self._lock:
+            running = [job for job in self._jobs.values() if job.status == 'running']
+        return {
+            'queued': self._queue.qsize(),
+            'running': len(running),
+            'fps': round(sum(job.fps for job in running), 2),
+            'max_workers': self.max_workers,
+            'max_queue': self.max_queue,
+        }
+
+    def _worker(self):
+        while True:
+            job, fn, args, kwargs = self._queue.get()
+            job.status = 'running'
+            job.started_at = time.time()
+            self._save(job, force=True)
+
+            def progress_callback(frames_done, total_frames, job=job):
+                job.update_progress(frames_done, total_frames)
+                self._save(job)
+
+            try:
+                job.result = fn(*args, progress_callback=progress_callback, **kwargs)
+                job.status = 'done'
+            except Exception as e:
+                traceback.print_exc()
+                job.error = str(e)
+                job.status = 'failed'
+            finally:
+                job.finished_at = time.time()
+                self._save(job, force=True)
+                self._retire(job)
+                self._queue.task_done()
+
+    def _retire(self, job):
+        with self._lock:
+            self._finished.append(job.id)
+            while len(self._finished) > self.max_finished:
+                self._jobs.pop(self._finished.pop(0), None)
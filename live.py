@@ -0,0 +1,276 @@
+"""
+Live stream mode: run the ANPR pipeline continuously on a camera feed.
+
+A capture thread reads the source as fast as it delivers frames and hands
+them to the processing thread through a small buffer governed by a drop
+policy, so a slow detector never lets latency grow without bound:
+
+- 'latest': keep only the newest frame (lowest latency, default)
+- 'drop_oldest': bounded queue, the oldest frame is discarded when full
+- 'drop_newest': bounded queue, incoming frames are discarded when full
+
+Frames older than max_latency_ms when they reach the processing thread are
+dropped as stale. Each stream keeps one long-lived Sort tracker and emits a
+plate event whenever a track gets a new plate reading.
+
+A local video file can stand in for a camera; it is replayed at its native
+frame rate. Run `python live.py <source>` to print events as JSON lines.
+"""
+import argparse
+import collections
+import json
+import os
+import threading
+import time
+
+import cv2
+
+from memory import governor
+from consensus import TrackConsensus
+from quality import QUALITY_GATE, QualityGate
+from watchlist import WatchlistMonitor, get_watchlist
+from sort.sort import Sort
+from video_source import make_frame
+
+DROP_POLICIES = ('latest', 'drop_oldest', 'drop_newest')
+
+
+class LiveStream(object):
+    """
+    Continuously process a camera feed, RTSP URL or a file replayed in real time.
+
+    Args:
+        source (str or int): Camera index, stream URL or video file path.
+        drop_policy (str): One of DROP_POLICIES.
+        max_queue (int): Buffer size for the drop_oldest / drop_newest policies.
+        max_latency_ms (float): Frames older than this are skipped. 0 disables the check.
+        realtime (bool): Pace reads at the source frame rate. Defaults to True for files.
+        on_event (callable): Called with each plate event dict.
+        max_events (int): Recent events kept for polling.
+        stream_id (str): Name used in events.
+        max_tracks (int): Tracks whose last reported plate is remembered to suppress repeats.
+    """
+
+    def __init__(self, source, drop_policy='latest', max_queue=4, max_latency_ms=1000, realtime=None,
+                 on_event=None, max_events=200, stream_id=None, max_tracks=1000):
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f"Unknown drop policy '{drop_policy}', expected one of {DROP_POLICIES}")
+        if isinstance(source, str) and source.isdigit():
+            source = int(source)
+        self.source = source
+        self.stream_id = stream_id or str(source)
+        self.drop_policy = drop_policy
+        self.max_queue = 1 if drop_policy == 'latest' else max(1, int(max_queue))
+        self.max_latency_ms = max_latency_ms
+        self.realtime = realtime if realtime is not None else (isinstance(source, str) and os.path.exists(source))
+        self.on_event = on_event
+        self.events = collections.deque(maxlen=max_events)
+
+        # One tracker for the lifetime of the stream so IDs stay stable
+        self.tracker = Sort()
+        self.quality_gate = QualityGate() if QUALITY_GATE else None
+        self.consensus = TrackConsensus(keep_final=False)
+        watchlist = get_watchlist()
+        self.watchlist = None
+        if watchlist is not None:
+            self.watchlist = WatchlistMonitor(watchlist, source=self.stream_id, on_match=self._emit_watchlist_hit,
+                                              max_events=max_events)
+        # Least recently reported tracks are forgotten first, so a stream that runs for
+        # weeks keeps a bounded map instead of one entry per car it ever saw
+        self.max_tracks = max_tracks
+        self._plates = collections.OrderedDict()
+
+        self._buffer = collections.deque()
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._source_done = False
+        self._threads = []
+
+        self.frames_captured = 0
+        self.frames_processed = 0
+        self.dropped_overflow = 0
+        self.dropped_stale = 0
+        self._latency_total_ms = 0.0
+        self.error = None
+
+    def start(self):
+        if not self._threads:
+            self._threads = [
+                threading.Thread(target=self._capture, name=f'live-capture-{self.stream_id}', daemon=True),
+                threading.Thread(target=self._process, name=f'live-process-{self.stream_id}', daemon=True),
+            ]
+            for thread in self._threads:
+                thread.start()
+        return self
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            if thread is not threading.current_thread():
+                thread.join(timeout=5)
+
+    @property
+    def running(self):
+        return any(thread.is_alive() for thread in self._threads)
+
+    def stats(self):
+        processed = self.frames_processed
+        return {
+            'stream_id': self.stream_id,
+            'running': self.running,
+            'drop_policy': self.drop_policy,
+            'frames_captured': self.frames_captured,
+            'frames_processed': processed,
+            'dropped_overflow': self.dropped_overflow,
+            'dropped_stale': self.dropped_stale,
+            'avg_latency_ms': round(self._latency_total_ms / processed, 1) if processed else 0.0,
+            'active_tracks': len(self.tracker.trackers),
+            'ocr_gate': self.quality_gate.stats() if self.quality_gate is not None else None,
+            'consensus': self.consensus.stats(),
+            'watchlist_hits': self.watchlist.hits if self.watchlist is not None else None,
+            'error': self.error,
+        }
+
+    def _push(self, item):
+        with self._cond:
+            if len(self._buffer) >= self.max_queue:
+                if self.drop_policy == 'drop_newest':
+                    self.dropped_overflow += 1
+                    return
+                self._buffer.popleft()
+                self.dropped_overflow += 1
+            self._buffer.append(item)
+            self._cond.notify_all()
+
+    def _capture(self):
+        import pipeline
+
+        cap = cv2.VideoCapture(self.source)
+        try:
+            if not cap.isOpened():
+                raise IOError(f"Could not open stream source {self.source!r}")
+            fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+            frame_interval = 1.0 / fps
+            next_due = time.time()
+            frame_nmr = 0
+            while not self._stopped:
+                ret, image = cap.read()
+                if not ret:
+                    break
+                captured_at = time.time()
+                self.frames_captured += 1
+                self._push((captured_at, make_frame(frame_nmr, image, pipeline.DETECT_SIZE)))
+                frame_nmr += 1
+                if self.realtime:
+                    next_due += frame_interval
+                    delay = next_due - time.time()
+                    if delay > 0:
+                        time.sleep(delay)
+                    else:
+                        next_due = time.time()
+        except Exception as e:
+            self.error = str(e)
+            print(f"Live capture error on {self.stream_id}: {e}")
+        finally:
+            cap.release()
+            with self._cond:
+                self._source_done = True
+                self._cond.notify_all()
+
+    def _next_frame(self):
+        with self._cond:
+            while not self._buffer and not self._source_done and not self._stopped:
+                self._cond.wait()
+            if self._stopped or not self._buffer:
+                return None
+            return self._buffer.popleft()
+
+    def _process(self):
+        import pipeline
+
+        try:
+            coco_model, license_plate_detector = pipeline.load_models()
+            while True:
+                item = self._next_frame()
+                if item is None:
+                    return
+                captured_at, frame_ = item
+                if self.max_latency_ms and (time.time() - captured_at) * 1000.0 > self.max_latency_ms:
+                    self.dropped_stale += 1
+                    continue
+
+                governor.check()
+                started_at = time.time()
+                frame_results = pipeline.process_frame(frame_, coco_model, license_plate_detector, self.tracker,
+                                                       self.quality_gate, self.consensus, self.watchlist)
+                processed_at = time.time()
+                self.frames_processed += 1
+                self._latency_total_ms += (processed_at - captured_at) * 1000.0
+
+                for car_id, result in frame_results.items():
+                    self._emit(frame_.index, car_id, result, captured_at, started_at, processed_at)
+        except Exception as e:
+            self.error = str(e)
+            print(f"Live processing error on {self.stream_id}: {e}")
+
+    def _emit(self, frame_nmr, car_id, result, captured_at, started_at, processed_at):
+        text = result['license_plate']['text']
+        # Only report a track when its plate reading changes
+        if self._plates.get(car_id) == text:
+            self._plates.move_to_end(car_id)
+            return
+        self._plates[car_id] = text
+        self._plates.move_to_end(car_id)
+        if len(self._plates) > self.max_tracks:
+            self._plates.popitem(last=False)
+        event = {
+            'stream_id': self.stream_id,
+            'frame_nmr': frame_nmr,
+            'car_id': int(car_id),
+            'plate': text,
+            'text_score': result['license_plate']['text_score'],
+            'car_bbox': [float(v) for v in result['car']['bbox']],
+            'plate_bbox': [float(v) for v in result['license_plate']['bbox']],
+            'captured_at': captured_at,
+            'processed_at': processed_at,
+            'queue_ms': round((started_at - captured_at) * 1000.0, 1),
+            'latency_ms': round((processed_at - captured_at) * 1000.0, 1),
+        }
+        self.events.append(event)
+        if self.on_event is not None:
+            self.on_event(event)
+
+    def _emit_watchlist_hit(self, event):
+        # Same keys as plate events where they overlap, so ?since= filtering works on both
+        event = dict(event, stream_id=self.stream_id, processed_at=event['time'])
+        self.events.append(event)
+        if self.on_event is not None:
+            self.on_event(event)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Run ANPR continuously on a live stream')
+    parser.add_argument('source', help='Camera index, RTSP/HTTP URL or a video file to replay in real time')
+    parser.add_argument('--policy', choices=DROP_POLICIES, default='latest', help='Frame drop policy [latest]')
+    parser.add_argument('--max-queue', type=int, default=4, help='Buffer size for the queue policies [4]')
+    parser.add_argument('--max-latency-ms', type=float, default=1000, help='Drop frames older than this [1000]')
+    parser.add_argument('--no-realtime', action='store_true', help='Read files as fast as possible')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    stream = LiveStream(args.source, drop_policy=args.policy, max_queue=args.max_queue,
+                        max_latency_ms=args.max_latency_ms, realtime=False if args.no_realtime else None,
+                        on_event=lambda event: print(json.dumps(event), flush=True))
+    stream.start()
+    try:
+        while stream.running:
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stream.stop()
+        print(json.dumps(stream.stats()))
@@ -0,0 +1,105 @@
+"""
+Measure web app startup time.
+
+Each run imports app.py in a fresh interpreter and reports how long the
+import took (the point where Flask can serve / and health checks) and which
+heavy libraries it pulled in. That import runs with the warm-up off, so
+nothing else can import a library meanwhile. A second interpreter, with the
+warm-up on, measures how long it takes until /ready reports the models as
+loaded. Both use empty temporary upload and output folders with job
+resumption off, so measuring never touches real jobs or files.
+
+    python measure_startup.py --runs 5
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+HEAVY_MODULES = ('torch', 'ultralytics', 'cv2', 'pandas', 'PIL', 'matplotlib', 'skimage', 'scipy', 'easyocr')
+
+_PROBE = '''
+import json, sys, time
+started_at = time.perf_counter()
+import app
+imported_at = time.perf_counter()
+report = {
+    'import_s': imported_at - started_at,
+    'heavy_modules': [name for name in %(heavy)r if name in sys.modules],
+}
+if %(wait_ready)r:
+    client = app.app.test_client()
+    while client.get('/ready').status_code != 200:
+        if app.warmer.status == 'failed':
+            report['warmup_error'] = app.warmer.error
+            break
+        time.sleep(0.05)
+    else:
+        report['ready_s'] = time.perf_counter() - started_at
+        report['warmup_steps'] = app.warmer.to_dict()['steps']
+print(json.dumps(report))
+'''
+
+
+def _probe(wait_ready):
+    """Run the probe in a fresh interpreter and return its report"""
+    workdir = tempfile.mkdtemp(prefix='anpr-startup-')
+    env = dict(os.environ,
+               ANPR_WARMUP='1' if wait_ready else '0',
+               ANPR_RESUME_JOBS='0',
+               ANPR_UPLOAD_FOLDER=os.path.join(workdir, 'uploads'),
+               ANPR_OUTPUT_FOLDER=os.path.join(workdir, 'outputs'))
+    env.pop('ANPR_PREFORK', None)
+    probe = _PROBE % {'heavy': HEAVY_MODULES, 'wait_ready': wait_ready}
+    try:
+        output = subprocess.run([sys.executable, '-c', probe], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                env=env, check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    # app.py prints startup messages; the report is the last line
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def measure(runs, wait_ready):
+    """
+    Import app.py `runs` times in fresh interpreters, plus `runs` more to time /ready.
+
+    Args:
+        runs (int): Number of interpreter starts.
+        wait_ready (bool): Also wait for /ready to turn 200.
+
+    Returns:
+        dict: Median import and ready times in seconds and the heavy modules seen.
+    """
+    reports = [_probe(wait_ready=False) for _ in range(runs)]
+    summary = {
+        'runs': runs,
+        'import_s': round(statistics.median(r['import_s'] for r in reports), 3),
+        'heavy_modules_at_import': reports[-1]['heavy_modules'],
+    }
+    # /ready in separate interpreters, so the warm-up thread can't skew the import figures
+    reports = [_probe(wait_ready=True) for _ in range(runs)] if wait_ready else []
+    ready_times = [r['ready_s'] for r in reports if 'ready_s' in r]
+    if ready_times:
+        summary['ready_s'] = round(statistics.median(ready_times), 3)
+        summary['warmup_steps'] = reports[-1]['warmup_steps']
+    errors = [r['warmup_error'] for r in reports if 'warmup_error' in r]
+    if errors:
+        summary['warmup_error'] = errors[-1]
+    return summary
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Measure how long app.py takes to start and to become ready')
+    parser.add_argument('--runs', type=int, default=3, help='Fresh interpreter starts to take the median of [3]')
+    parser.add_argument('--no-ready', action='store_true', help='Only time the import, skip waiting for /ready')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    print(json.dumps(measure(max(1, args.runs), not args.no_ready), indent=2))
@@ -0,0 +1,264 @@
+"""
+Process memory helpers.
+
+Reads /proc on Linux (Render, Hugging Face) and falls back to psutil or
+resource.getrusage elsewhere, so callers can report RSS without a hard
+dependency. MemoryGovernor adapts processing settings to stay under a
+memory ceiling such as the 512 MB of a Render free instance.
+"""
+import contextlib
+import gc
+import os
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    _PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+except (AttributeError, ValueError, OSError):
+    _PAGE_SIZE = 4096
+
+
+def current_rss_mb():
+    """Resident set size of this process in MB"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE / (1024 * 1024)
+    except (OSError, IndexError, ValueError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    except ImportError:
+        return peak_rss_mb()
+
+
+def peak_rss_mb():
+    """Highest resident set size this process has reached, in MB"""
+    if resource is None:
+        return 0.0
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KB everywhere else
+    if sys.platform == 'darwin':
+        return maxrss / (1024 * 1024)
+    return maxrss / 1024
+
+
+def smaps_rollup(pid='self'):
+    """
+    Split a process's memory into pages shared with other processes and private ones.
+
+    Args:
+        pid (int or str): Process ID, or 'self'.
+
+    Returns:
+        dict: 'rss', 'pss', 'shared' and 'private' in MB, or None where
+            /proc/<pid>/smaps_rollup is unavailable (non-Linux, kernels before 4.14).
+    """
+    fields = {}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == 'kB':
+                    fields[parts[0].rstrip(':')] = int(parts[1]) / 1024
+    except (OSError, ValueError):
+        return None
+    return {
+        'rss': fields.get('Rss', 0.0),
+        'pss': fields.get('Pss', 0.0),
+        'shared': fields.get('Shared_Clean', 0.0) + fields.get('Shared_Dirty', 0.0),
+        'private': fields.get('Private_Clean', 0.0) + fields.get('Private_Dirty', 0.0),
+    }
+
+
+class RssTracker(object):
+    """Track the highest RSS seen across explicit sample() calls"""
+
+    def __init__(self):
+        self.start_mb = current_rss_mb()
+        self.peak_mb = self.start_mb
+
+    def sample(self):
+        rss = current_rss_mb()
+        if rss > self.peak_mb:
+            self.peak_mb = rss
+        return rss
+
+
+def container_limit_mb():
+    """Memory limit of this process's cgroup in MB, or None when unlimited or unknown"""
+    for path in ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes'):
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        # cgroup v2 reports "max"; v1 reports a huge number when unlimited
+        if value.isdigit() and int(value) < 1 << 50:
+            return int(value) / (1024 * 1024)
+    return None
+
+
+def system_memory_mb():
+    """Physical memory of the machine in MB, or None when unknown"""
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') / (1024 * 1024)
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def default_limit_mb():
+    """
+    Governor ceiling: ANPR_MEMORY_LIMIT_MB when set (0 turns the governor off),
+    else 90% of the container limit, else 90% of physical memory. The headroom
+    is there because RSS is only sampled between frames.
+    """
+    configured = os.environ.get('ANPR_MEMORY_LIMIT_MB', '')
+    if configured.strip():
+        return float(configured)
+    return (container_limit_mb() or system_memory_mb() or 0) * 0.9
+
+
+def halvings(value, levels=4):
+    """[value, value/2, value/4, ...] down to 1, one entry per governor level"""
+    return [max(1, int(value) >> level) for level in range(levels)]
+
+
+class MemoryGovernor(object):
+    """
+    Keep RSS under a ceiling by collecting garbage and degrading settings under pressure.
+
+    Settings register as knobs: a list of values from normal to most
+    conservative plus a function that applies one. The governor holds a
+    pressure level shared by all knobs; above the high watermark it
+    collects garbage and, if that isn't enough, moves every knob one level
+    down. Below the low watermark, after a cooldown, it moves back up.
+
+    Args:
+        limit_mb (float): Memory ceiling in MB. None or 0 disables level changes.
+        high_ratio (float): Fraction of the limit above which the level rises.
+        soft_ratio (float): Fraction of the limit above which garbage is collected.
+        low_ratio (float): Fraction of the limit below which the level falls again.
+        interval (float): Minimum seconds between RSS samples.
+        cooldown (float): Minimum seconds between level changes.
+    """
+
+    def __init__(self, limit_mb=None, high_ratio=0.9, soft_ratio=0.8, low_ratio=0.65, interval=0.5, cooldown=5.0):
+        self.limit_mb = limit_mb or None
+        self.high_ratio = high_ratio
+        self.soft_ratio = soft_ratio
+        self.low_ratio = low_ratio
+        self.interval = interval
+        self.cooldown = cooldown
+        self.level = 0
+        self.max_level = 0
+        self.rss_mb = current_rss_mb()
+        self.collections = 0
+        self.adjustments = 0
+        self._knobs = {}
+        self._lock = threading.Lock()
+        self._sampled_at = 0.0
+        self._changed_at = 0.0
+        self._collected_at = 0.0
+        self._rss_after_collect = 0.0
+
+    def register(self, name, values, apply):
+        """
+        Add a knob and apply the value for the current level.
+
+        Args:
+            name (str): Name used in log messages; registering a name again replaces the knob.
+            values (list): Setting per level, normal first. The last value is reused at deeper levels.
+            apply (callable): Called with the new value whenever the level changes.
+        """
+        with self._lock:
+            self._knobs[name] = (list(values), apply)
+            self.max_level = max(len(values) - 1 for values, _ in self._knobs.values())
+            apply(self._value(values))
+
+    def unregister(self, name):
+        with self._lock:
+            self._knobs.pop(name, None)
+
+    @contextlib.contextmanager
+    def knob(self, name, values, apply):
+        """Register a knob for the duration of a with block"""
+        self.register(name, values, apply)
+        try:
+            yield
+        finally:
+            self.unregister(name)
+
+    def _value(self, values):
+        return values[min(self.level, len(values) - 1)]
+
+    def check(self):
+        """
+        Sample RSS (at most every `interval` seconds) and react to pressure.
+
+        Cheap enough to call once per frame. Concurrent callers don't wait;
+        whoever holds the lock does the check for everyone.
+        """
+        now = time.time()
+        if now - self._sampled_at < self.interval or not self._lock.acquire(blocking=False):
+            return
+        try:
+            self._sampled_at = now
+            self.rss_mb = current_rss_mb()
+            if not self.limit_mb:
+                return
+            # Collect when RSS has grown since the last collection, not on every sample above the
+            # watermark: a full collection costs tens of milliseconds on a large heap
+            grown = self.rss_mb - self._rss_after_collect > self.limit_mb * 0.02
+            stale = now - self._collected_at >= self.cooldown * 6
+            if self.rss_mb > self.limit_mb * self.soft_ratio and (grown or stale):
+                self._collect(now)
+            if now - self._changed_at < self.cooldown:
+                return
+            if self.rss_mb > self.limit_mb * self.high_ratio and self.level < self.max_level:
+                self._set_level(self.level + 1, now)
+            elif self.rss_mb < self.limit_mb * self.low_ratio and self.level > 0:
+                self._set_level(self.level - 1, now)
+        finally:
+            self._lock.release()
+
+    def _collect(self, now):
+        before = self.rss_mb
+        gc.collect()
+        self._collected_at = now
+        self.collections += 1
+        self.rss_mb = self._rss_after_collect = current_rss_mb()
+        print(f"Memory governor: collected garbage at {before:.0f}/{self.limit_mb:.0f} MB, "
+              f"now {self.rss_mb:.0f} MB")
+
+    def _set_level(self, level, now):
+        old_level, self.level = self.level, level
+        self._changed_at = now
+        self.adjustments += 1
+        changes = []
+        for name, (values, apply) in self._knobs.items():
+            old, new = values[min(old_level, len(values) - 1)], self._value(values)
+            if old != new:
+                apply(new)
+                changes.append(f'{name} {old}->{new}')
+        print(f"Memory governor: RSS {self.rss_mb:.0f}/{self.limit_mb:.0f} MB, level {old_level}->{level}"
+              + (': ' + ', '.join(changes) if changes else ''))
+
+    def stats(self):
+        return {
+            'rss_mb': round(self.rss_mb, 1),
+            'limit_mb': self.limit_mb,
+            'level': self.level,
+            'collections': self.collections,
+            'adjustments': self.adjustments,
+        }
+
+
+# Process-wide governor
+governor = MemoryGovernor(default_limit_mb())
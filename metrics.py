@@ -0,0 +1,235 @@
+"""
+Prometheus-style metrics without a client library dependency.
+
+Counters, gauges and histograms are plain Python objects updated in place;
+render() produces the text exposition format served at /metrics. Recording
+an observation is a perf_counter() pair, a bisect and two additions, which
+is negligible next to a detector call.
+
+Each process keeps its own values, so under prefork.py a scrape sees the
+worker that answered it.
+"""
+import bisect
+import threading
+import time
+
+# Seconds; spans a single OCR call up to rendering a long video
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_registry = []
+_registry_lock = threading.Lock()
+
+
+def _format_labels(labelnames, values):
+    if not labelnames:
+        return ''
+    pairs = ','.join('{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                     for name, value in zip(labelnames, values))
+    return '{' + pairs + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+class _Metric(object):
+    """Base for metric families: a name, help text and one child per label combination"""
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def labels(self, *values):
+        """Child for one label combination; look it up once and keep it for hot paths"""
+        values = tuple(str(value) for value in values)
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _default(self):
+        return self.labels() if not self.labelnames else None
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for values, child in sorted(self._children.items()):
+            lines.extend(child.render(self.name, self.labelnames, values))
+        return lines
+
+
+class _CounterChild(object):
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def render(self, name, labelnames, values):
+        return [f'{name}{_format_labels(labelnames, values)} {_format_value(self.value)}']
+
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+
+class _GaugeChild(object):
+    __slots__ = ('value', 'function')
+
+    def __init__(self):
+        self.value = 0.0
+        self.function = None
+
+    def set(self, value):
+        self.value = value
+
+    def set_function(self, function):
+        """Read the value from function() at scrape time instead of storing it"""
+        self.function = function
+
+    def render(self, name, labelnames, values):
+        value = self.value
+        if self.function is not None:
+            try:
+                value = self.function()
+            except Exception:
+                return []
+        return [f'{name}{_format_labels(labelnames, values)} {_format_value(value)}']
+
+
+class Gauge(_Metric):
+    """Value that can go up and down, or be computed when scraped"""
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), function=None):
+        super(Gauge, self).__init__(name, documentation, labelnames)
+        if function is not None:
+            self.set_function(function)
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value):
+        self._default().set(value)
+
+    def set_function(self, function):
+        self._default().set_function(function)
+
+
+class _Timer(object):
+    __slots__ = ('child', 'started_at')
+
+    def __init__(self, child):
+        self.child = child
+
+    def __enter__(self):
+        self.started_at = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.child.observe(time.perf_counter() - self.started_at)
+
+
+class _HistogramChild(object):
+    __slots__ = ('upper_bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, upper_bounds):
+        self.upper_bounds = upper_bounds
+        self.counts = [0] * (len(upper_bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        # A lost update under a rare thread switch only skews a scrape by one sample
+        self.counts[bisect.bisect_left(self.upper_bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def time(self):
+        """Context manager observing the duration of its block"""
+        return _Timer(self)
+
+    def render(self, name, labelnames, values):
+        lines = []
+        cumulative = 0
+        for upper_bound, count in zip(self.upper_bounds + (float('inf'),), self.counts):
+            cumulative += count
+            labels = _format_labels(labelnames + ('le',), values + (_format_value(upper_bound),))
+            lines.append(f'{name}_bucket{labels} {cumulative}')
+        labels = _format_labels(labelnames, values)
+        lines.append(f'{name}_sum{labels} {_format_value(self.sum)}')
+        lines.append(f'{name}_count{labels} {self.count}')
+        return lines
+
+
+class Histogram(_Metric):
+    """
+    Distribution of observed values in cumulative buckets.
+
+    Args:
+        name (str): Metric name.
+        documentation (str): Help text.
+        labelnames (tuple): Label names.
+        buckets (tuple): Sorted bucket upper bounds; +Inf is added automatically.
+    """
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=STAGE_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super(Histogram, self).__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self._default().observe(value)
+
+    def time(self):
+        return self._default().time()
+
+
+def render():
+    """All registered metrics in the Prometheus text exposition format"""
+    with _registry_lock:
+        metrics = list(_registry)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+STAGE_SECONDS = Histogram('anpr_stage_seconds', 'Time spent in each processing stage', ('stage',))
+FRAMES_PROCESSED = Counter('anpr_frames_processed_total', 'Video frames run through detection and tracking')
+PLATES_READ = Counter('anpr_plates_read_total', 'Plate crops that produced a reading')
+OCR_SKIPPED = Counter('anpr_ocr_skipped_total', 'Plate crops not sent to OCR', ('reason',))
+
+# Observed once per frame, except ocr (once per plate crop) and csv (once per job)
+DECODE = STAGE_SECONDS.labels('decode')
+VEHICLE_DETECTION = STAGE_SECONDS.labels('vehicle_detection')
+TRACKING = STAGE_SECONDS.labels('tracking')
+PLATE_DETECTION = STAGE_SECONDS.labels('plate_detection')
+OCR = STAGE_SECONDS.labels('ocr')
+RENDER = STAGE_SECONDS.labels('render')
+CSV = STAGE_SECONDS.labels('csv')
@@ -0,0 +1,261 @@
+"""
+Model server: one process owns the YOLO models and the OCR reader and serves
+detection and OCR to any number of lightweight web workers over a local
+Unix socket.
+
+Pixels never travel over the socket. Each client thread owns a shared-memory
+segment; it writes the image there once, and the request only carries the
+segment name, shape and dtype. The server maps the same memory as a NumPy
+array and runs the model on it directly.
+
+Start the server, then point workers at it:
+
+    python model_server.py --socket /tmp/anpr-models.sock
+    ANPR_MODEL_SERVER=/tmp/anpr-models.sock python app.py
+
+Connections are authenticated, because requests are unpickled. The key is
+ANPR_MODEL_SERVER_KEY when set. Otherwise the server writes a random key to
+<socket>.key, readable by its own user only, and workers running as that
+user read it from there. The socket itself is also private to the user.
+"""
+import argparse
+import os
+import secrets
+import threading
+import weakref
+from multiprocessing import resource_tracker
+from multiprocessing.connection import Client, Listener
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from util import DetectionResult
+
+DEFAULT_SOCKET = '/tmp/anpr-models.sock'
+
+
+def _authkey(address, create=False):
+    """
+    Key both ends authenticate with.
+
+    Args:
+        address (str): Socket path; the generated key lives in '<address>.key'.
+        create (bool): Write a new random key file (server side) instead of reading it.
+
+    Returns:
+        bytes: ANPR_MODEL_SERVER_KEY if set, else the key file's contents.
+    """
+    key = os.environ.get('ANPR_MODEL_SERVER_KEY')
+    if key:
+        return key.encode()
+    path = address + '.key'
+    if create:
+        if os.path.exists(path):
+            os.remove(path)
+        # O_EXCL: never write into a file someone else planted at this path
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            f.write(secrets.token_hex(32))
+    stat = os.stat(path)
+    if stat.st_uid != os.getuid() or stat.st_mode & 0o077:
+        raise PermissionError(f"{path} must belong to this user and be readable by it only")
+    with open(path) as f:
+        return f.read().strip().encode()
+
+
+def _attach(name):
+    """Map a client's segment without letting this process's resource tracker unlink it on exit"""
+    shm = SharedMemory(name=name)
+    resource_tracker.unregister(shm._name, 'shared_memory')
+    return shm
+
+
+class ModelServer(object):
+    """
+    Serve detection and OCR requests from the models loaded in this process.
+
+    Args:
+        address (str): Unix socket path to listen on.
+    """
+
+    def __init__(self, address=DEFAULT_SOCKET):
+        self.address = address
+        self._ocr_lock = threading.Lock()
+
+    def serve_forever(self):
+        import pipeline
+        import util
+        from warmup import WarmUp
+
+        # Load and exercise everything now rather than on the first client request
+        WarmUp(use_server=False).run()
+        self.pipeline = pipeline
+        self.models = dict(zip(('coco', 'plate'), pipeline.load_models(use_server=False)))
+        self.read_license_plate = util.read_license_plate
+
+        if os.path.exists(self.address):
+            os.remove(self.address)
+        authkey = _authkey(self.address, create=True)
+        # Bind the socket as 0600 so no other user can even connect
+        umask = os.umask(0o177)
+        try:
+            listener = Listener(self.address, family='AF_UNIX', authkey=authkey)
+        finally:
+            os.umask(umask)
+        os.chmod(self.address, 0o600)
+        print(f"Model server listening on {self.address}")
+        try:
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception as e:
+                    print(f"Model server rejected a connection: {e}")
+                    continue
+                threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+        finally:
+            listener.close()
+
+    def _handle(self, conn):
+        segments = {}
+        try:
+            while True:
+                try:
+                    request = conn.recv()
+                except EOFError:
+                    return
+                try:
+                    conn.send(('ok', self._dispatch(request, segments)))
+                except Exception as e:
+                    conn.send(('error', str(e)))
+        finally:
+            for shm in segments.values():
+                shm.close()
+            conn.close()
+
+    def _view(self, segments, name, shape, dtype):
+        shm = segments.get(name)
+        if shm is None:
+            # A client only owns one segment at a time; a new name means the old one was replaced
+            for old in segments.values():
+                old.close()
+            segments.clear()
+            shm = segments[name] = _attach(name)
+        return np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+    def _dispatch(self, request, segments):
+        op = request[0]
+        if op == 'ping':
+            return 'pong'
+        if op == 'detect':
+            _, model_name, name, shape, dtype = request
+            image = self._view(segments, name, shape, dtype)
+            with self.pipeline._inference_lock:
+                return self.models[model_name](image)[0].boxes.data.tolist()
+        if op == 'ocr':
+            _, name, shape, dtype = request
+            crop = self._view(segments, name, shape, dtype)
+            with self._ocr_lock:
+                text, score = self.read_license_plate(crop)
+            return text, None if score is None else float(score)
+        raise ValueError(f"Unknown model server operation '{op}'")
+
+
+class _Channel(object):
+    """A connection plus a growable shared-memory segment, owned by one client thread"""
+
+    def __init__(self, address):
+        self.conn = Client(address, family='AF_UNIX', authkey=_authkey(address))
+        self.shm = None
+        self._finalizer = None
+
+    def buffer(self, nbytes):
+        if self.shm is None or self.shm.size < nbytes:
+            self.close_segment()
+            # Round up so small size changes don't reallocate
+            self.shm = SharedMemory(create=True, size=max(nbytes, 1 << 20))
+            self._finalizer = weakref.finalize(self, _release_segment, self.shm)
+        return self.shm
+
+    def close_segment(self):
+        if self._finalizer is not None:
+            self._finalizer()
+            self._finalizer = None
+        self.shm = None
+
+    def call(self, request):
+        self.conn.send(request)
+        status, value = self.conn.recv()
+        if status != 'ok':
+            raise RuntimeError(f"Model server error: {value}")
+        return value
+
+
+def _release_segment(shm):
+    shm.close()
+    shm.unlink()
+
+
+class ModelClient(object):
+    """
+    Client side of the model server. Safe to share between threads; each
+    thread gets its own connection and shared-memory segment.
+
+    Args:
+        address (str): Unix socket path of the server.
+    """
+
+    def __init__(self, address=DEFAULT_SOCKET):
+        self.address = address
+        self._local = threading.local()
+
+    def _channel(self):
+        channel = getattr(self._local, 'channel', None)
+        if channel is None:
+            channel = self._local.channel = _Channel(self.address)
+        return channel
+
+    def _share(self, channel, image):
+        image = np.ascontiguousarray(image)
+        shm = channel.buffer(image.nbytes)
+        np.ndarray(image.shape, dtype=image.dtype, buffer=shm.buf)[...] = image
+        return shm.name, image.shape, image.dtype.str
+
+    def ping(self):
+        return self._channel().call(('ping',))
+
+    def detect(self, model_name, image):
+        """Run 'coco' or 'plate' on image; returns rows of [x1, y1, x2, y2, score, class_id]"""
+        channel = self._channel()
+        return channel.call(('detect', model_name) + self._share(channel, image))
+
+    def read_license_plate(self, crop):
+        """Same contract as util.read_license_plate, executed by the server's OCR reader"""
+        channel = self._channel()
+        return tuple(channel.call(('ocr',) + self._share(channel, crop)))
+
+    def model(self, model_name):
+        return RemoteModel(self, model_name)
+
+
+class RemoteModel(object):
+    """Callable with the subset of the ultralytics YOLO interface the pipeline uses"""
+
+    def __init__(self, client, model_name):
+        self.client = client
+        self.model_name = model_name
+        self.overrides = {}
+
+    def __call__(self, source, **kwargs):
+        images = source if isinstance(source, list) else [source]
+        return [DetectionResult(self.client.detect(self.model_name, image)) for image in images]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Serve ANPR detection and OCR to local web workers')
+    parser.add_argument('--socket', default=os.environ.get('ANPR_MODEL_SERVER', DEFAULT_SOCKET),
+                        help=f'Unix socket path [{DEFAULT_SOCKET}]')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    ModelServer(parse_args().socket).serve_forever()
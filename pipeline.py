@@ -0,0 +1,565 @@
+"""
+ANPR processing engine: model loading, per-frame detection/tracking/OCR and
+whole-video processing. Shared by the Flask app and the live stream mode.
+"""
+import os
+import gc
+import threading
+import time
+
+# Cache/config locations must be set before ultralytics is imported
+os.environ['TORCH_HOME'] = '/tmp/.cache/torch' if os.environ.get('RENDER') else '.cache/torch'
+os.environ['YOLO_CONFIG_DIR'] = '/tmp/.config/Ultralytics' if os.environ.get('RENDER') else '.config/Ultralytics'
+
+import cv2
+import numpy as np
+from sort.sort import Sort
+from util import get_car, read_license_plate, write_csv
+from video_source import FrameSource, make_frame
+from video_writer import open_video_writer, output_extension
+from checkpoint import Checkpointer
+from memory import governor, halvings
+from quality import QUALITY_GATE, QualityGate
+from consensus import TrackConsensus
+from plate_store import get_store
+from watchlist import WatchlistMonitor, get_watchlist
+from track_summary import SUMMARY_NAME, TrackSummary
+from clips import OUTPUT_MODE, OUTPUT_MODES, write_clips
+from plate_gallery import CROP_FORMAT, PlateGallery
+import metrics
+import profiling
+from profiling import span
+
+def _import_yolo():
+    """Import ultralytics/torch on first local model load; model-server clients never need them"""
+    from ultralytics import YOLO
+    import torch
+    from PIL import Image
+    
+    # Fix for newer Pillow versions
+    if not hasattr(Image, 'ANTIALIAS'):
+        Image.ANTIALIAS = Image.LANCZOS
+    
+    # Patch torch.load for PyTorch 2.6+
+    if not getattr(torch.load, 'patched_weights_only', False):
+        _original_torch_load = torch.load
+        def _patched_torch_load(*args, **kwargs):
+            kwargs['weights_only'] = False
+            return _original_torch_load(*args, **kwargs)
+        _patched_torch_load.patched_weights_only = True
+        torch.load = _patched_torch_load
+    return YOLO
+
+# COCO class IDs: car, motorcycle, bus, truck
+VEHICLES = [2, 3, 5, 7]
+
+# Detector input size (YOLO resizes to 640 internally) and decode read-ahead
+DETECT_SIZE = int(os.environ.get('ANPR_DETECT_SIZE', 640))
+FRAME_BUFFER_SIZE = int(os.environ.get('ANPR_FRAME_BUFFER', 8))
+# Detection sizes the memory governor steps through under pressure
+DETECT_SIZES = [DETECT_SIZE] + [size for size in (512, 416, 320) if not DETECT_SIZE or size < DETECT_SIZE]
+# Frames between checkpoints of an in-progress job (0 disables checkpointing)
+CHECKPOINT_EVERY = int(os.environ.get('ANPR_CHECKPOINT_EVERY', 250))
+
+# Global model cache - load once, reuse
+_models_cache = {'coco': None, 'plate': None}
+_models_lock = threading.Lock()
+# Job workers share the cached models; ultralytics predictors are not thread-safe
+_inference_lock = threading.Lock()
+# Replaced by the model server client's OCR when ANPR_MODEL_SERVER is set
+_plate_ocr = read_license_plate
+
+def load_models(use_server=True):
+    """
+    Load models once and cache them to save memory.
+
+    With ANPR_MODEL_SERVER set (and use_server=True) the models are proxies
+    for a model_server.py process instead of local copies.
+    """
+    with _models_lock:
+        server = os.environ.get('ANPR_MODEL_SERVER') if use_server else None
+        if server:
+            return _connect_model_server(server)
+        return _load_models()
+
+def install_models(coco_model, license_plate_detector, plate_ocr=None):
+    """
+    Use the given detectors (and OCR function) instead of loading the YOLO weights.
+
+    Any callable that takes an image (or a list of images) and returns objects
+    with `boxes.data`, such as lists of util.DetectionResult, works as a
+    detector. Used by the benchmark's stub models. plate_ocr=None restores
+    util.read_license_plate; None detectors make the next load_models load
+    the YOLO weights again.
+    """
+    global _plate_ocr
+    with _models_lock:
+        _models_cache['coco'] = coco_model
+        _models_cache['plate'] = license_plate_detector
+        _plate_ocr = plate_ocr if plate_ocr is not None else read_license_plate
+
+def models_loaded():
+    """Whether both detectors are loaded (or connected to a model server)"""
+    return _models_cache['coco'] is not None and _models_cache['plate'] is not None
+
+def _connect_model_server(address):
+    global _plate_ocr
+    if _models_cache['coco'] is None:
+        from model_server import ModelClient
+        client = ModelClient(address)
+        client.ping()
+        _models_cache['coco'] = client.model('coco')
+        _models_cache['plate'] = client.model('plate')
+        _plate_ocr = client.read_license_plate
+        print(f"Using model server at {address}")
+    return _models_cache['coco'], _models_cache['plate']
+
+def _load_models():
+    if _models_cache['coco'] is None:
+        print("Loading YOLO models...")
+        YOLO = _import_yolo()
+        
+        # Force garbage collection before loading
+        gc.collect()
+        
+        # Load models with minimal settings for memory efficiency
+        _models_cache['coco'] = YOLO('yolov8n.pt')
+        _models_cache['coco'].overrides['verbose'] = False
+        
+        # Clear cache between model loads
+        gc.collect()
+        
+        _models_cache['plate'] = YOLO('license_plate_detector.pt')
+        _models_cache['plate'].overrides['verbose'] = False
+        
+        # Final cleanup
+        gc.collect()
+        print("Models loaded successfully!")
+    return _models_cache['coco'], _models_cache['plate']
+
+def plate_crop(image, x1, y1, x2, y2):
+    """Grayscale crop of a plate box from a full-resolution image, or None if the box is empty"""
+    license_plate_crop = image[int(y1):int(y2), int(x1): int(x2), :]
+    if license_plate_crop.size == 0:
+        return None
+    return cv2.cvtColor(license_plate_crop, cv2.COLOR_BGR2GRAY)
+
+def read_plate_gray(license_plate_crop_gray):
+    """Threshold a grayscale plate crop and run OCR"""
+    _, license_plate_crop_thresh = cv2.threshold(license_plate_crop_gray, 64, 255, cv2.THRESH_BINARY_INV)
+    return _plate_ocr(license_plate_crop_thresh)
+
+def read_plate(image, x1, y1, x2, y2):
+    """Crop a plate box out of a full-resolution image, threshold it and run OCR"""
+    license_plate_crop_gray = plate_crop(image, x1, y1, x2, y2)
+    if license_plate_crop_gray is None:
+        return None, None
+    return read_plate_gray(license_plate_crop_gray)
+
+def process_frame(frame_, coco_model, license_plate_detector, mot_tracker, quality_gate=None, consensus=None,
+                  watchlist=None):
+    """
+    Detect, track and read plates in one frame.
+
+    Args:
+        frame_ (video_source.Frame): Decoded frame with its downscaled detection copy.
+        coco_model: Vehicle detector.
+        license_plate_detector: Plate detector.
+        mot_tracker (Sort): Tracker for the video or stream the frame belongs to.
+        quality_gate (quality.QualityGate): Gate for the same video or stream; crops it
+            rejects skip OCR.
+        consensus (consensus.TrackConsensus): Per-track votes for the same video or stream;
+            when given, each car reports its consensus text, frames without OCR reuse it,
+            and OCR stops once it is decisive.
+        watchlist (watchlist.WatchlistMonitor): Checks every OCR read against the watchlist.
+
+    Returns:
+        dict: {car_id: {'car': {...}, 'license_plate': {...}}} for cars with a plate read. text
+            and text_score are the track's consensus; ocr_text and ocr_score what OCR returned
+            in this frame, None when the reading was carried forward.
+    """
+    frame = frame_.image
+    frame_results = {}
+    
+    # Detect vehicles
+    with _inference_lock, metrics.VEHICLE_DETECTION.time(), span('vehicle_detection'):
+        detections = coco_model(frame_.small)[0]
+    detections_ = []
+    for detection in frame_.full_res_boxes(detections.boxes.data.tolist()):
+        x1, y1, x2, y2, score, class_id = detection
+        if int(class_id) in VEHICLES:
+            detections_.append([x1, y1, x2, y2, score])
+    
+    # Track vehicles
+    with metrics.TRACKING.time(), span('tracking'):
+        track_ids = mot_tracker.update(np.asarray(detections_))
+    
+    # Detect license plates
+    with _inference_lock, metrics.PLATE_DETECTION.time(), span('plate_detection'):
+        license_plates = license_plate_detector(frame_.small)[0]
+    for license_plate in frame_.full_res_boxes(license_plates.boxes.data.tolist()):
+        x1, y1, x2, y2, score, class_id = license_plate
+        
+        # Assign license plate to car
+        xcar1, ycar1, xcar2, ycar2, car_id = get_car(license_plate, track_ids)
+        
+        if car_id != -1:
+            license_plate_crop_gray = plate_crop(frame, x1, y1, x2, y2)
+            if license_plate_crop_gray is None:
+                continue
+            
+            # What OCR returned for this crop; None when it didn't run or found no plate
+            ocr_text, ocr_score = None, None
+            if consensus is not None and consensus.decisive(car_id, frame_.index):
+                license_plate_text, license_plate_text_score = consensus.reading(car_id, frame_.index)
+            elif quality_gate is None or quality_gate.admit(car_id, frame_.index, license_plate_crop_gray):
+                # Read license plate number
+                with metrics.OCR.time(), span('ocr'):
+                    license_plate_text, license_plate_text_score = read_plate_gray(license_plate_crop_gray)
+                ocr_text, ocr_score = license_plate_text, license_plate_text_score
+                if license_plate_text is not None:
+                    metrics.PLATES_READ.inc()
+                    if watchlist is not None:
+                        watchlist.check(car_id, frame_.index, license_plate_text, license_plate_text_score)
+                if consensus is not None:
+                    license_plate_text, license_plate_text_score = consensus.add(
+                        car_id, frame_.index, license_plate_text, license_plate_text_score)
+            elif consensus is not None:
+                license_plate_text, license_plate_text_score = consensus.reading(car_id, frame_.index)
+            else:
+                continue
+            
+            if license_plate_text is not None:
+                frame_results[car_id] = {
+                    'car': {'bbox': [xcar1, ycar1, xcar2, ycar2]},
+                    'license_plate': {
+                        'bbox': [x1, y1, x2, y2],
+                        'text': license_plate_text,
+                        'bbox_score': score,
+                        'text_score': license_plate_text_score,
+                        'ocr_text': ocr_text,
+                        'ocr_score': ocr_score
+                    }
+                }
+    
+    if quality_gate is not None:
+        quality_gate.end_frame(frame_.index)
+    if consensus is not None:
+        consensus.end_frame(frame_.index)
+    metrics.FRAMES_PROCESSED.inc()
+    return frame_results
+
+def decode_image(data):
+    """Decode an encoded image (JPEG, PNG, ...) to a BGR array, or None if it is not an image"""
+    return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+
+def recognize_images(images):
+    """
+    Detect vehicles and plates and read plate text in a batch of still images.
+
+    Both detectors run once over the whole batch; there is no tracking, so
+    plates are linked to the vehicle box that contains them, if any.
+
+    Args:
+        images (list): BGR images (numpy.ndarray), any sizes.
+
+    Returns:
+        list: One {'vehicles': [...], 'plates': [...]} dict per image.
+    """
+    coco_model, license_plate_detector = load_models()
+    governor.check()
+    frames = [make_frame(i, image, DETECT_SIZE) for i, image in enumerate(images)]
+    smalls = [frame_.small for frame_ in frames]
+    
+    with _inference_lock:
+        vehicle_batch = coco_model(smalls)
+        plate_batch = license_plate_detector(smalls)
+    
+    output = []
+    for frame_, detections, license_plates in zip(frames, vehicle_batch, plate_batch):
+        vehicles = [detection[:5] for detection in frame_.full_res_boxes(detections.boxes.data.tolist())
+                    if int(detection[5]) in VEHICLES]
+        # get_car expects [x1, y1, x2, y2, id]; use the vehicle's index as its ID
+        vehicle_boxes = [vehicle[:4] + [i] for i, vehicle in enumerate(vehicles)]
+        
+        plates = []
+        for license_plate in frame_.full_res_boxes(license_plates.boxes.data.tolist()):
+            x1, y1, x2, y2, score, class_id = license_plate
+            vehicle_index = get_car(license_plate, vehicle_boxes)[4]
+            text, text_score = read_plate(frame_.image, x1, y1, x2, y2)
+            plates.append({
+                'bbox': [x1, y1, x2, y2],
+                'score': score,
+                'text': text,
+                'text_score': text_score,
+                'vehicle': None if vehicle_index == -1 else int(vehicle_index),
+            })
+        
+        output.append({
+            'vehicles': [{'bbox': vehicle[:4], 'score': vehicle[4]} for vehicle in vehicles],
+            'plates': plates,
+        })
+    return output
+
+def process_video(video_path, output_folder, start_frame=0, end_frame=None, progress_callback=None, profile=None,
+                  record_detections=None, replay_detections=None, output_mode=None, store_reads=True):
+    """
+    Process video with ANPR and return paths to results - Memory optimized
+
+    With profile=True (or ANPR_PROFILE=1 when profile is None) every stage of
+    every frame is recorded, and trace.json plus a summary table are written
+    to output_folder.
+
+    record_detections is a .npz path to save both detectors' raw output to;
+    replay_detections is such a file to use instead of running the models
+    (see detection_log.py).
+
+    output_mode is 'video' for the full annotated video, 'clips' for short
+    clips around each track (see clips.py) or 'both'; None uses ANPR_OUTPUT_MODE.
+
+    store_reads=False keeps the run out of the plate store (plate_store.py), e.g.
+    for benchmarks. Replays never write to it: they repeat a recorded run.
+    """
+    if record_detections and replay_detections:
+        raise ValueError('Detections can be recorded or replayed, not both')
+    output_mode = output_mode or OUTPUT_MODE
+    if output_mode not in OUTPUT_MODES:
+        raise ValueError(f"Unknown output mode '{output_mode}', expected one of {OUTPUT_MODES}")
+    if profile is None:
+        profile = profiling.enabled_by_env()
+    profiler = profiling.Profiler(f'anpr {os.path.basename(video_path)}') if profile else None
+    previous_profiler = profiling.activate(profiler)
+    started_at = time.perf_counter()
+    store_writer = None
+    try:
+        detection_log = None
+        if replay_detections:
+            from detection_log import DetectionLog
+            detection_log = DetectionLog(replay_detections)
+            coco_model, license_plate_detector = detection_log.models()
+        else:
+            # Load cached models
+            with span('load_models'):
+                coco_model, license_plate_detector = load_models()
+        
+        # Pick up where a recycled or killed process left off
+        checkpointer = Checkpointer(output_folder, every=CHECKPOINT_EVERY)
+        state = checkpointer.load()
+        if state is not None:
+            mot_tracker = state['tracker']
+            results = state['results']
+            saved = state['state']
+            start_frame = max(start_frame, state['frame_nmr'] + 1)
+        else:
+            mot_tracker = Sort()
+            results = {}
+            saved = {}
+        summary = TrackSummary()
+        for frame_nmr in sorted(results):
+            summary.add(frame_nmr, results[frame_nmr])
+        
+        # Decode on a background thread; detectors get a 640px copy, OCR the full-res frame
+        source = FrameSource(video_path, detect_size=DETECT_SIZE, buffer_size=FRAME_BUFFER_SIZE,
+                             start_frame=start_frame, end_frame=end_frame, profiler=profiler)
+        total_frames = source.total_frames
+        
+        if record_detections:
+            from detection_log import DetectionRecorder
+            detection_log = DetectionRecorder(frame_size=(source.width, source.height),
+                                              video=os.path.basename(video_path))
+            coco_model, license_plate_detector = detection_log.wrap(coco_model, license_plate_detector)
+        
+        # Restored with the tracker, so a resumed job keeps its OCR budgets, votes and alerts
+        quality_gate = None
+        if QUALITY_GATE:
+            quality_gate = saved.get('quality_gate') or QualityGate()
+        consensus = saved.get('consensus')
+        if consensus is None:
+            consensus = TrackConsensus()
+            consensus.rebuild(results)
+        
+        # The output folder name is unique per upload, so it doubles as the store's job key
+        job_name = os.path.basename(os.path.normpath(output_folder))
+        watchlist = get_watchlist()
+        if watchlist is not None:
+            watchlist = WatchlistMonitor(watchlist, source=job_name)
+            if saved.get('watchlist'):
+                watchlist.restore(saved['watchlist'])
+        store = get_store() if store_reads and not replay_detections else None
+        if store is not None:
+            store_writer = store.writer(job_name, video=os.path.basename(video_path), fps=source.fps,
+                                        start_frame=start_frame)
+        
+        # Crops saved by an interrupted run stay valid; tracks overwrite them as their best box improves
+        gallery = PlateGallery(output_folder) if CROP_FORMAT else None
+        
+        print(f"Processing {total_frames} frames...")
+        
+        # Under memory pressure the governor shrinks the detector input and the read-ahead
+        with source, \
+             governor.knob(f'detect_size[{job_name}]', DETECT_SIZES,
+                           lambda size: setattr(source, 'detect_size', size)), \
+             governor.knob(f'frame_buffer[{job_name}]', halvings(FRAME_BUFFER_SIZE),
+                           lambda size: setattr(source, 'buffer_size', size)):
+            for frame_ in source:
+                frame_nmr = frame_.index
+                
+                if frame_nmr % 50 == 0:
+                    print(f"Processing frame {frame_nmr}/{total_frames}")
+                with span('frame', frame=frame_nmr):
+                    # Collects garbage and adjusts settings only when RSS nears the limit
+                    governor.check()
+                    
+                    if detection_log is not None:
+                        detection_log.begin_frame(frame_nmr)
+                    results[frame_nmr] = process_frame(frame_, coco_model, license_plate_detector, mot_tracker,
+                                                       quality_gate, consensus, watchlist)
+                    
+                    with span('checkpoint'):
+                        checkpointer.add(frame_nmr, results[frame_nmr])
+                        if checkpointer.due(frame_nmr):
+                            checkpointer.save(frame_nmr, mot_tracker, {
+                                'quality_gate': quality_gate,
+                                'consensus': consensus,
+                                'watchlist': watchlist.state() if watchlist is not None else None,
+                            })
+                    improved = summary.add(frame_nmr, results[frame_nmr])
+                    if gallery is not None and improved:
+                        with span('gallery'):
+                            gallery.update(frame_.image, results[frame_nmr], improved)
+                    if store_writer is not None:
+                        with span('store'):
+                            store_writer.add(frame_nmr, results[frame_nmr])
+                
+                if progress_callback is not None:
+                    progress_callback(frame_nmr + 1, total_frames)
+        
+        # One plate text per track: rewrite early frames with the final vote
+        for car_id, (text, score) in consensus.finalize(results).items():
+            summary.set_plate(car_id, text, score)
+        tracks_path = summary.write(os.path.join(output_folder, SUMMARY_NAME))
+        if store_writer is not None:
+            store_writer.finish(summary.rows(), frames=len(results))
+        
+        # Write results to CSV
+        csv_path = os.path.join(output_folder, 'results.csv')
+        with metrics.CSV.time(), span('csv'):
+            write_csv(results, csv_path)
+        
+        result = {
+            'csv': csv_path,
+            'tracks': tracks_path,
+        }
+        if gallery is not None:
+            result['crops'] = gallery.write_manifest(summary.rows())
+        if output_mode in ('video', 'both'):
+            print("Generating output video...")
+            # Generate output video directly from raw results
+            # H.264 fragmented MP4 when ffmpeg is available, XVID AVI otherwise
+            result['video'] = os.path.join(output_folder, 'output' + output_extension())
+            with span('render'):
+                generate_output_video_simple(video_path, csv_path, result['video'])
+        if output_mode in ('clips', 'both'):
+            # Only the frames around tracks are decoded and encoded
+            with span('clips'):
+                result['clips'] = write_clips(video_path, results, summary.rows(), output_folder)
+        
+        checkpointer.clear()
+        
+        if quality_gate is not None:
+            result['ocr_gate'] = quality_gate.stats()
+            print(f"OCR gate: {result['ocr_gate']['ocr_calls']} of {result['ocr_gate']['crops']} plate crops read")
+        result['consensus'] = consensus.stats()
+        if watchlist is not None:
+            result['watchlist_hits'] = list(watchlist.events)
+        if record_detections:
+            result['detections'] = detection_log.save(record_detections)
+        if profiler is not None:
+            profiler.add('process_video', started_at, time.perf_counter())
+            result.update(profiler.save(output_folder))
+        return result
+        
+    except Exception as e:
+        print(f"Error processing video: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        # A failing job would fail again after a restart, so don't resume it
+        Checkpointer(output_folder).clear()
+        if store_writer is not None:
+            store_writer.fail()
+        # The trace up to the failure is often what explains it
+        if profiler is not None:
+            profiler.add('process_video', started_at, time.perf_counter(), {'error': str(e)})
+            profiler.save(output_folder)
+        raise e
+    finally:
+        profiling.activate(previous_profiler)
+
+def generate_output_video_simple(input_video, csv_file, output_video):
+    """Generate visualization video from CSV results"""
+    import ast
+    import pandas as pd
+    
+    # Check if CSV exists and has data
+    if not os.path.exists(csv_file):
+        print(f"CSV file not found: {csv_file}")
+        return
+    
+    results = pd.read_csv(csv_file)
+    if len(results) == 0:
+        print("No results found in CSV")
+        return
+        
+    cap = cv2.VideoCapture(input_video)
+    
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    out = open_video_writer(output_video, fps, (width, height))
+    
+    frame_nmr = -1
+    ret = True
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    
+    print(f"Rendering {total_frames} frames...")
+    
+    while ret:
+        ret, frame = cap.read()
+        frame_nmr += 1
+        
+        if frame_nmr % 100 == 0:
+            print(f"Rendering frame {frame_nmr}/{total_frames}")
+        
+        if ret:
+            render_started_at = time.perf_counter()
+            # Get detections for this frame
+            df_ = results[results['frame_nmr'] == frame_nmr]
+            
+            for row_indx in range(len(df_)):
+                try:
+                    # Draw car bounding box
+                    car_bbox = ast.literal_eval(df_.iloc[row_indx]['car_bbox'].replace('[ ', '[').replace('   ', ' ').replace('  ', ' ').replace(' ', ','))
+                    car_x1, car_y1, car_x2, car_y2 = car_bbox
+                    cv2.rectangle(frame, (int(car_x1), int(car_y1)), (int(car_x2), int(car_y2)), (0, 255, 0), 3)
+                    
+                    # Draw license plate bounding box
+                    lp_bbox = ast.literal_eval(df_.iloc[row_indx]['license_plate_bbox'].replace('[ ', '[').replace('   ', ' ').replace('  ', ' ').replace(' ', ','))
+                    x1, y1, x2, y2 = lp_bbox
+                    cv2.rectangle(frame, (int(x1), int(y1)), (int(x2), int(y2)), (0, 0, 255), 2)
+                    
+                    # Add license plate text
+                    license_text = str(df_.iloc[row_indx]['license_number'])
+                    cv2.putText(frame, license_text, (int(car_x1), int(car_y1) - 10),
+                               cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 255, 0), 2)
+                except Exception as e:
+                    print(f"Error processing frame {frame_nmr}, row {row_indx}: {e}")
+                    continue
+            
+            out.write(frame)
+            render_finished_at = time.perf_counter()
+            metrics.RENDER.observe(render_finished_at - render_started_at)
+            profiling.record('render_frame', render_started_at, render_finished_at, frame=frame_nmr)
+    
+    out.release()
+    cap.release()
+    print("Video rendering complete!")
@@ -0,0 +1,194 @@
+"""
+Regional plate formats.
+
+A format is a layout string with one class per character: 'L' for a letter,
+'D' for a digit. Each one is compiled once into
+
+- a regex that also accepts the characters OCR commonly confuses with the
+  expected class (util.dict_char_to_int / util.dict_int_to_char), and
+- lookup tables over ASCII codes: accepted, accepted without correction, and
+  the corrected character.
+
+FormatMatcher checks a batch of OCR candidates against every active format
+with a few NumPy indexing operations per candidate length and returns the
+best candidate: the highest OCR score, discounted for every character that
+needed correcting. ANPR_PLATE_FORMATS is a comma-separated list of FORMATS
+names (default 'uk').
+"""
+import os
+import re
+import string
+import threading
+
+import numpy as np
+
+from util import dict_char_to_int, dict_int_to_char
+
+# Score multiplier per character that had to be corrected to fit the format
+CORRECTION_PENALTY = 0.9
+
+_CLASSES = {
+    'L': (string.ascii_uppercase, dict_int_to_char),
+    'D': (string.digits, dict_char_to_int),
+}
+
+
+class PlateFormat(object):
+    """
+    One plate syntax.
+
+    Args:
+        name (str): Registry name.
+        layout (str): One 'L' (letter) or 'D' (digit) per character, e.g. 'LLDDLLL'.
+        description (str): Example plate, for documentation.
+    """
+
+    def __init__(self, name, layout, description=''):
+        if not layout or set(layout) - set(_CLASSES):
+            raise ValueError(f"Layout '{layout}' must only contain {sorted(_CLASSES)}")
+        self.name = name
+        self.layout = layout
+        self.description = description
+        self.pattern = re.compile(''.join(
+            '[' + re.escape(_CLASSES[kind][0] + ''.join(_CLASSES[kind][1])) + ']' for kind in layout))
+
+        # (length, 128) tables indexed by position and ASCII code
+        self.accept = np.zeros((len(layout), 128), dtype=bool)
+        self.strict = np.zeros((len(layout), 128), dtype=bool)
+        self.normalized = np.zeros((len(layout), 128), dtype=np.uint8)
+        for position, kind in enumerate(layout):
+            chars, corrections = _CLASSES[kind]
+            for char in chars:
+                self.accept[position, ord(char)] = self.strict[position, ord(char)] = True
+                self.normalized[position, ord(char)] = ord(char)
+            for char, corrected in corrections.items():
+                self.accept[position, ord(char)] = True
+                self.normalized[position, ord(char)] = ord(corrected)
+
+    def __len__(self):
+        return len(self.layout)
+
+    def __repr__(self):
+        return f'PlateFormat({self.name!r}, {self.layout!r})'
+
+    def matches(self, text):
+        return self.pattern.fullmatch(text) is not None
+
+    def normalize(self, text):
+        """Correct confusable characters to the class the layout expects; text must match"""
+        codes = np.frombuffer(text.encode('ascii'), dtype=np.uint8)
+        return self.normalized[np.arange(len(self)), codes].tobytes().decode('ascii')
+
+
+FORMATS = {plate_format.name: plate_format for plate_format in (
+    PlateFormat('uk', 'LLDDLLL', 'AB12 CDE, current UK'),
+    PlateFormat('uk_suffix', 'LLLDDDL', 'ABC 123D, UK 1963-1983'),
+    PlateFormat('uk_prefix', 'LDDDLLL', 'A123 BCD, UK 1983-2001'),
+    PlateFormat('fr', 'LLDDDLL', 'AB-123-CD, France and Italy'),
+    PlateFormat('es', 'DDDDLLL', '1234 BCD, Spain'),
+    PlateFormat('us_ca', 'DLLLDDD', '7ABC123, California'),
+)}
+
+
+def _clean(text):
+    return text.upper().replace(' ', '')
+
+
+class FormatMatcher(object):
+    """
+    Match OCR candidates against a set of formats.
+
+    Args:
+        formats (list): PlateFormat objects.
+    """
+
+    def __init__(self, formats):
+        if not formats:
+            raise ValueError('At least one plate format is required')
+        self.formats = list(formats)
+        # Stack the tables of same-length formats so one indexing op checks all of them
+        self._by_length = {}
+        for length in sorted({len(plate_format) for plate_format in self.formats}):
+            group = [plate_format for plate_format in self.formats if len(plate_format) == length]
+            self._by_length[length] = (
+                group,
+                np.stack([plate_format.accept for plate_format in group]),
+                np.stack([plate_format.strict for plate_format in group]),
+                np.stack([plate_format.normalized for plate_format in group]),
+            )
+
+    @property
+    def lengths(self):
+        return tuple(self._by_length)
+
+    def layouts(self, length):
+        """Layouts of the active formats with the given length"""
+        group = self._by_length.get(length)
+        return [plate_format.layout for plate_format in group[0]] if group else []
+
+    def match(self, candidates):
+        """
+        Pick the best plate among OCR candidates.
+
+        Args:
+            candidates (list): (text, score) pairs, e.g. every detection EasyOCR returned.
+
+        Returns:
+            tuple: (normalized text, score, format name) of the best candidate, or None
+                if no candidate matches an active format.
+        """
+        by_length = {}
+        for text, score in candidates:
+            text = _clean(text)
+            if len(text) in self._by_length and text.isascii():
+                by_length.setdefault(len(text), []).append((text, float(score)))
+
+        best = None
+        for length, group_candidates in by_length.items():
+            group, accept, strict, normalized = self._by_length[length]
+            codes = np.frombuffer(''.join(text for text, _ in group_candidates).encode('ascii'),
+                                  dtype=np.uint8).reshape(-1, length)
+            scores = np.array([score for _, score in group_candidates])
+            positions = np.arange(length)
+            # (formats, candidates) after reducing over positions
+            ok = accept[:, positions, codes].all(axis=-1)
+            corrections = (~strict[:, positions, codes]).sum(axis=-1)
+            ranked = np.where(ok, scores[None, :] * CORRECTION_PENALTY ** corrections, -np.inf)
+            f, c = np.unravel_index(int(np.argmax(ranked)), ranked.shape)
+            if ok[f, c] and (best is None or ranked[f, c] > best[0]):
+                text = normalized[f, positions, codes[c]].tobytes().decode('ascii')
+                best = (ranked[f, c], text, group_candidates[c][1], group[f].name)
+        if best is None:
+            return None
+        return best[1], best[2], best[3]
+
+
+_matcher = None
+_matcher_lock = threading.Lock()
+
+
+def get_matcher():
+    """FormatMatcher for the formats named in ANPR_PLATE_FORMATS, built on first use"""
+    global _matcher
+    if _matcher is None:
+        with _matcher_lock:
+            if _matcher is None:
+                names = [name.strip() for name in os.environ.get('ANPR_PLATE_FORMATS', 'uk').split(',') if name.strip()]
+                unknown = [name for name in names if name not in FORMATS]
+                if unknown:
+                    raise ValueError(f"Unknown plate formats {unknown}, expected some of {sorted(FORMATS)}")
+                _matcher = FormatMatcher([FORMATS[name] for name in names])
+    return _matcher
+
+
+def best_plate(candidates):
+    """
+    Best normalized plate among (text, score) candidates for the active formats.
+
+    Returns:
+        tuple: (text, score), or (None, None) when no candidate fits a format.
+    """
+    match = get_matcher().match(candidates)
+    if match is None:
+        return None, None
+    return match[0], match[1]
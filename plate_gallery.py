@@ -0,0 +1,161 @@
+"""
+Best plate crop per track.
+
+TrackSummary already ranks every plate box of a track (area times detector
+confidence). Whenever a track's best box improves, PlateGallery cuts the
+crop out of the frame the pipeline has already decoded and saves it as a
+small JPEG or WebP, so the gallery needs no second pass over the video.
+manifest.json maps each crop to its car_id, frame and final plate text.
+
+stream_zip packs the manifest and crops into a ZIP while it is being sent:
+zipfile writes to a non-seekable buffer that is drained after every file,
+so no archive is ever written to disk or held in memory whole.
+
+ANPR_CROP_FORMAT is 'jpg' (default) or 'webp'; empty disables the gallery.
+"""
+import json
+import os
+import zipfile
+
+import cv2
+
+GALLERY_DIR = 'plates'
+MANIFEST_NAME = 'manifest.json'
+CROP_FORMATS = {
+    'jpg': cv2.IMWRITE_JPEG_QUALITY,
+    'webp': cv2.IMWRITE_WEBP_QUALITY,
+}
+CROP_FORMAT = os.environ.get('ANPR_CROP_FORMAT', 'jpg')
+CROP_QUALITY = int(os.environ.get('ANPR_CROP_QUALITY', 90))
+# Context kept around the plate box, as a fraction of its width and height
+CROP_MARGIN = 0.1
+
+
+class PlateGallery(object):
+    """
+    Keep the best plate crop of every track of one video on disk.
+
+    Args:
+        output_folder (str): Job folder; crops go in its GALLERY_DIR subfolder.
+        image_format (str): A CROP_FORMATS key.
+        quality (int): Encoder quality, 0-100.
+    """
+
+    def __init__(self, output_folder, image_format=CROP_FORMAT, quality=CROP_QUALITY):
+        if image_format not in CROP_FORMATS:
+            raise ValueError(f"Unknown crop format '{image_format}', expected one of {sorted(CROP_FORMATS)}")
+        self.folder = os.path.join(output_folder, GALLERY_DIR)
+        self.image_format = image_format
+        self._params = [CROP_FORMATS[image_format], int(quality)]
+        self.saved = 0
+        os.makedirs(self.folder, exist_ok=True)
+
+    def filename(self, car_id):
+        return f'car_{int(car_id)}.{self.image_format}'
+
+    def save(self, car_id, image, bbox):
+        """
+        Crop a plate box out of a full-resolution frame and save it as the track's crop.
+
+        Returns:
+            str: Path written, or None if the box is empty.
+        """
+        height, width = image.shape[:2]
+        x1, y1, x2, y2 = bbox
+        margin_x, margin_y = (x2 - x1) * CROP_MARGIN, (y2 - y1) * CROP_MARGIN
+        crop = image[max(0, int(y1 - margin_y)):min(height, int(y2 + margin_y)),
+                     max(0, int(x1 - margin_x)):min(width, int(x2 + margin_x))]
+        if crop.size == 0:
+            return None
+        ok, data = cv2.imencode('.' + self.image_format, crop, self._params)
+        if not ok:
+            return None
+        path = os.path.join(self.folder, self.filename(car_id))
+        with open(path, 'wb') as f:
+            f.write(data.tobytes())
+        self.saved += 1
+        return path
+
+    def update(self, image, frame_results, car_ids):
+        """
+        Save the crops of the tracks whose best plate box is in this frame.
+
+        Args:
+            image (np.ndarray): Full-resolution BGR frame.
+            frame_results (dict): {car_id: {...}} from process_frame for the same frame.
+            car_ids (list): Tracks returned by TrackSummary.add for the frame.
+        """
+        for car_id in car_ids:
+            self.save(car_id, image, frame_results[car_id]['license_plate']['bbox'])
+
+    def write_manifest(self, tracks):
+        """
+        Write manifest.json for the crops on disk.
+
+        Args:
+            tracks (list): track_summary.TrackSummary.rows() after the final consensus was applied.
+
+        Returns:
+            str: Path of manifest.json.
+        """
+        crops = []
+        for track in tracks:
+            name = self.filename(track['car_id'])
+            if not os.path.exists(os.path.join(self.folder, name)):
+                continue
+            crops.append({
+                'file': name,
+                'car_id': track['car_id'],
+                'frame_nmr': track['best_frame'],
+                'license_number': track['license_number'],
+                'license_number_score': track['license_number_score'],
+                'license_plate_bbox': track['best_license_plate_bbox'],
+                'car_bbox': track['best_car_bbox'],
+            })
+        path = os.path.join(self.folder, MANIFEST_NAME)
+        with open(path, 'w') as f:
+            json.dump({'format': self.image_format, 'crops': crops}, f, indent=2)
+        return path
+
+
+class _ZipBuffer(object):
+    """Write-only sink for zipfile; having no tell() makes zipfile stream with data descriptors"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_zip(manifest_path):
+    """
+    ZIP of a gallery's manifest and the crops it lists, generated file by file.
+
+    Args:
+        manifest_path (str): manifest.json written by PlateGallery.write_manifest.
+
+    Yields:
+        bytes: Consecutive parts of the archive.
+    """
+    folder = os.path.dirname(manifest_path)
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    buffer = _ZipBuffer()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.write(manifest_path, MANIFEST_NAME, compress_type=zipfile.ZIP_DEFLATED)
+        yield buffer.take()
+        for crop in manifest['crops']:
+            # Crops are already compressed images, so they are stored as is
+            archive.write(os.path.join(folder, crop['file']), crop['file'], compress_type=zipfile.ZIP_STORED)
+            yield buffer.take()
+    yield buffer.take()
@@ -0,0 +1,248 @@
+"""
+Persistent plate read store.
+
+Every processed video adds its job, each plate read (what OCR returned, in
+the frames where it ran) and, once it finishes, one row per track to a local
+SQLite database, so a plate can be looked up
+across all videos long after their results.csv files were downloaded and
+deleted. The database runs in WAL mode, so lookups never wait for a job
+that is writing; reads are inserted in batched transactions while the job
+runs, and indexes on plate text, time and job keep lookups in the
+millisecond range.
+
+ANPR_DB_PATH sets the database file (empty disables the store).
+"""
+import os
+import sqlite3
+import threading
+import time
+
+DB_PATH = os.environ.get('ANPR_DB_PATH', '/tmp/plates.db' if os.environ.get('RENDER') else 'plates.db')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    video TEXT,
+    fps REAL,
+    status TEXT,
+    started_at REAL,
+    finished_at REAL,
+    frames INTEGER
+);
+CREATE TABLE IF NOT EXISTS reads (
+    job_id TEXT NOT NULL,
+    frame_nmr INTEGER NOT NULL,
+    car_id INTEGER NOT NULL,
+    plate TEXT NOT NULL,
+    score REAL,
+    bbox_score REAL,
+    video_time REAL,
+    created_at REAL NOT NULL,
+    track_plate TEXT
+);
+CREATE TABLE IF NOT EXISTS tracks (
+    job_id TEXT NOT NULL,
+    car_id INTEGER NOT NULL,
+    plate TEXT NOT NULL,
+    score REAL,
+    first_frame INTEGER,
+    last_frame INTEGER,
+    reads INTEGER,
+    PRIMARY KEY (job_id, car_id)
+);
+CREATE INDEX IF NOT EXISTS reads_plate ON reads (plate);
+CREATE INDEX IF NOT EXISTS reads_track_plate ON reads (track_plate);
+CREATE INDEX IF NOT EXISTS reads_created_at ON reads (created_at);
+CREATE INDEX IF NOT EXISTS reads_job ON reads (job_id, car_id);
+CREATE INDEX IF NOT EXISTS tracks_plate ON tracks (plate);
+"""
+
+
+def normalize_plate(text):
+    """Plate text as stored: upper case without spaces or dashes"""
+    return text.upper().replace(' ', '').replace('-', '')
+
+
+class PlateStore(object):
+    """
+    SQLite plate database shared by the threads of one process.
+
+    Args:
+        path (str): Database file.
+    """
+
+    def __init__(self, path=DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            # Databases created before reads.track_plate existed
+            if conn.execute("SELECT name FROM sqlite_master WHERE name = 'reads'").fetchone() and \
+               'track_plate' not in [row[1] for row in conn.execute('PRAGMA table_info(reads)')]:
+                conn.execute('ALTER TABLE reads ADD COLUMN track_plate TEXT')
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        """This thread's connection; sqlite3 connections can't be shared between threads"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            # Durable at checkpoints instead of every commit; losing the last batch on power loss is fine
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def writer(self, job_id, video=None, fps=None, start_frame=0, batch_size=500):
+        """JobWriter recording one job's reads"""
+        return JobWriter(self, job_id, video, fps, start_frame, batch_size)
+
+    def sightings(self, plate, prefix=False, limit=100):
+        """
+        Every track that carried a plate, across all jobs, newest first.
+
+        Tracks of jobs still running are aggregated from their reads.
+
+        Args:
+            plate (str): Plate text.
+            prefix (bool): Match plates starting with the text instead of the exact plate.
+            limit (int): Most tracks returned.
+
+        Returns:
+            list: Dicts with job_id, video, car_id, plate, score, first_frame, last_frame,
+                first_seen (seconds into the video), reads and status.
+        """
+        plate = normalize_plate(plate)
+        if prefix:
+            # A range on the indexed column instead of LIKE, which SQLite won't index case-sensitively
+            condition, params = '{0}.plate >= ? AND {0}.plate < ?', (plate, plate + '\uffff')
+        else:
+            condition, params = '{0}.plate = ?', (plate,)
+        query = f"""
+            SELECT t.job_id, j.video, t.car_id, t.plate, t.score, t.first_frame, t.last_frame,
+                   t.first_frame / NULLIF(j.fps, 0) AS first_seen, t.reads, j.status, j.started_at
+            FROM tracks t JOIN jobs j ON j.job_id = t.job_id
+            WHERE {condition.format('t')}
+            UNION ALL
+            SELECT r.job_id, j.video, r.car_id, r.plate, MAX(r.score), MIN(r.frame_nmr), MAX(r.frame_nmr),
+                   MIN(r.video_time), COUNT(*), j.status, j.started_at
+            FROM reads r JOIN jobs j ON j.job_id = r.job_id
+            WHERE {condition.format('r')} AND j.status = 'running'
+            GROUP BY r.job_id, r.car_id, r.plate
+            ORDER BY started_at DESC, first_frame
+            LIMIT ?
+        """
+        rows = self._connect().execute(query, params + params + (int(limit),)).fetchall()
+        return [{key: row[key] for key in row.keys() if key != 'started_at'} for row in rows]
+
+    def reads(self, plate, limit=1000):
+        """
+        OCR reads of an exact plate, newest first: reads of that text, and reads of
+        tracks whose final plate it is. plate and score are what OCR returned;
+        track_plate is the track's final plate once its job has finished.
+        """
+        plate = normalize_plate(plate)
+        rows = self._connect().execute(
+            'SELECT job_id, frame_nmr, car_id, plate, score, bbox_score, video_time, created_at, track_plate '
+            'FROM reads WHERE plate = ? OR track_plate = ? ORDER BY created_at DESC LIMIT ?',
+            (plate, plate, int(limit))).fetchall()
+        return [dict(row) for row in rows]
+
+    def stats(self):
+        conn = self._connect()
+        return {table: conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+                for table in ('jobs', 'reads', 'tracks')}
+
+
+class JobWriter(object):
+    """
+    Buffer one job's reads and write them in batched transactions.
+
+    Args:
+        store (PlateStore): Store to write to.
+        job_id (str): Job key, unique per processed video.
+        video (str): Video name.
+        fps (float): Video frame rate, to turn frame numbers into video time.
+        start_frame (int): First frame this run processes; reads from an interrupted
+            run at or after it are replaced.
+        batch_size (int): Reads per transaction.
+    """
+
+    def __init__(self, store, job_id, video=None, fps=None, start_frame=0, batch_size=500):
+        self.store = store
+        self.job_id = job_id
+        self.fps = fps or None
+        self.batch_size = batch_size
+        self._rows = []
+        with store._connect() as conn:
+            conn.execute('INSERT INTO jobs (job_id, video, fps, status, started_at) VALUES (?, ?, ?, ?, ?) '
+                         'ON CONFLICT (job_id) DO UPDATE SET status = excluded.status',
+                         (job_id, video, self.fps, 'running', time.time()))
+            conn.execute('DELETE FROM reads WHERE job_id = ? AND frame_nmr >= ?', (job_id, int(start_frame)))
+
+    def add(self, frame_nmr, frame_results):
+        """Queue the OCR reads of one processed frame; readings carried forward are skipped"""
+        now = time.time()
+        video_time = frame_nmr / self.fps if self.fps else None
+        for car_id, result in frame_results.items():
+            plate = result['license_plate']
+            if plate.get('ocr_text') is None:
+                continue
+            self._rows.append((self.job_id, frame_nmr, int(car_id), normalize_plate(plate['ocr_text']),
+                               plate['ocr_score'], plate['bbox_score'], video_time, now, None))
+        if len(self._rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self._rows:
+            return
+        with self.store._connect() as conn:
+            conn.executemany('INSERT INTO reads (job_id, frame_nmr, car_id, plate, score, bbox_score, video_time, '
+                             'created_at, track_plate) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', self._rows)
+        self._rows = []
+
+    def finish(self, tracks, frames=None, status='done'):
+        """
+        Write the remaining reads and one row per track, and mark the job finished.
+
+        Args:
+            tracks (list): track_summary.TrackSummary.rows() after the final consensus was
+                applied. Their texts go in the tracks table and in reads.track_plate; the
+                reads keep the text and score OCR returned.
+            frames (int): Frames processed.
+            status (str): Final job status.
+        """
+        self.flush()
+        rows = [(self.job_id, track['car_id'], normalize_plate(track['license_number']), track['license_number_score'],
+                 track['first_frame'], track['last_frame'], track['frames']) for track in tracks]
+        with self.store._connect() as conn:
+            conn.executemany('UPDATE reads SET track_plate = ? WHERE job_id = ? AND car_id = ?',
+                             [(row[2], self.job_id, row[1]) for row in rows])
+            conn.execute('DELETE FROM tracks WHERE job_id = ?', (self.job_id,))
+            conn.executemany('INSERT INTO tracks VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+            # tracks.reads counts the frames where OCR ran, like the reads table
+            conn.execute('UPDATE tracks SET reads = (SELECT COUNT(*) FROM reads r WHERE r.job_id = tracks.job_id '
+                         'AND r.car_id = tracks.car_id) WHERE job_id = ?', (self.job_id,))
+            conn.execute('UPDATE jobs SET status = ?, finished_at = ?, frames = ? WHERE job_id = ?',
+                         (status, time.time(), frames, self.job_id))
+
+    def fail(self):
+        """Write the remaining reads and mark the job failed"""
+        self.flush()
+        with self.store._connect() as conn:
+            conn.execute('UPDATE jobs SET status = ?, finished_at = ? WHERE job_id = ?',
+                         ('failed', time.time(), self.job_id))
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """The PlateStore at ANPR_DB_PATH, opened on first use; None when the store is disabled"""
+    global _store
+    if _store is None and DB_PATH:
+        with _store_lock:
+            if _store is None:
+                _store = PlateStore(DB_PATH)
+    return _store
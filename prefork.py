@@ -0,0 +1,148 @@
+"""
+Prefork server: load and warm the models once, then fork web workers.
+
+The master process imports the app, loads both YOLO models and the OCR
+reader and runs one dummy inference through each, then freezes the garbage
+collector so those objects are never touched by a collection again. Workers
+forked afterwards share the model memory copy-on-write instead of each
+loading a private copy on their first request.
+
+    python prefork.py --workers 4 --port 5000
+
+A few seconds after startup the master prints how much of each worker's
+memory is still shared with the master and how much is private.
+"""
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+
+# Threads don't survive fork(); keep torch/OpenMP single-threaded so children don't
+# inherit a thread pool that is dead in their copy of the process
+os.environ.setdefault('OMP_NUM_THREADS', '1')
+os.environ['ANPR_PREFORK'] = '1'
+
+import app as web
+from memory import current_rss_mb, smaps_rollup
+
+
+def _serve(sock, worker_index, resumable=None):
+    from werkzeug.serving import make_server
+
+    if resumable:
+        web.resume_interrupted_jobs(resumable)
+    server = make_server(sock.getsockname()[0], sock.getsockname()[1], web.app, threaded=True, fd=sock.fileno())
+    signal.signal(signal.SIGTERM, lambda signum, frame: os._exit(0))
+    print(f"Worker {worker_index} (pid {os.getpid()}) serving")
+    server.serve_forever()
+
+
+def _spawn(sock, worker_index, resumable=None):
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            _serve(sock, worker_index, resumable)
+        except Exception as e:
+            print(f"Worker {worker_index} crashed: {e}")
+            code = 1
+        finally:
+            os._exit(code)
+    return pid
+
+
+def memory_report(workers):
+    """
+    Print shared versus private memory of the master and each worker.
+
+    Args:
+        workers (dict): {pid: worker_index} of the running workers.
+    """
+    master = smaps_rollup()
+    if master is None:
+        print(f"Memory report unavailable on this platform (master RSS {current_rss_mb():.1f} MB)")
+        return
+    print(f"{'process':<16}{'rss MB':>10}{'shared MB':>12}{'private MB':>12}{'pss MB':>10}")
+    rows = [('master', master)] + [(f'worker {index}', smaps_rollup(pid)) for pid, index in sorted(workers.items())]
+    for name, usage in rows:
+        if usage is not None:
+            print(f"{name:<16}{usage['rss']:>10.1f}{usage['shared']:>12.1f}{usage['private']:>12.1f}{usage['pss']:>10.1f}")
+
+
+def run(host, port, workers, report_delay=5.0):
+    """Warm the models, fork `workers` processes sharing one listening socket and keep them alive"""
+    # Same warm-up the app runs in the background, so /ready in the workers shows its timings
+    web.warmer.run()
+    if web.warmer.status != 'done':
+        sys.exit(f"Warm-up failed, not starting workers: {web.warmer.error}")
+    # Objects created so far live for the whole process; moving them out of the collector's
+    # generations keeps gc from writing to their headers and un-sharing the pages
+    gc.collect()
+    gc.freeze()
+    print(f"Master RSS after warm-up {current_rss_mb():.1f} MB")
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(128)
+    sock.set_inheritable(True)
+    print(f"Listening on http://{host}:{port} with {workers} workers")
+
+    # Interrupted jobs are collected once, here, and handed to the first worker. Restarted
+    # workers never resume: jobs in the job folder may be running in the other workers
+    resumable = web.find_resumable_jobs(web.app.config['OUTPUT_FOLDER']) if web.app.config['RESUME_JOBS'] else []
+    children = {_spawn(sock, index, resumable if index == 0 else None): index for index in range(workers)}
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    if report_delay:
+        timer = threading.Timer(report_delay, memory_report, args=(children,))
+        timer.daemon = True
+        timer.start()
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        index = children.pop(pid, None)
+        if index is None or stopping:
+            continue
+        print(f"Worker {index} (pid {pid}) exited with status {status}, restarting")
+        time.sleep(1)
+        children[_spawn(sock, index)] = index
+    sock.close()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Serve the ANPR web app from forked workers sharing preloaded models')
+    parser.add_argument('--host', default='0.0.0.0', help='Address to bind [0.0.0.0]')
+    parser.add_argument('--port', type=int, default=int(os.environ.get('PORT', 5000)), help='Port to bind [$PORT or 5000]')
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('ANPR_WEB_WORKERS', 2)),
+                        help='Worker processes [$ANPR_WEB_WORKERS or 2]')
+    parser.add_argument('--report-delay', type=float, default=5.0,
+                        help='Seconds after startup to print the memory report, 0 to skip [5]')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    if not hasattr(os, 'fork'):
+        sys.exit('prefork.py needs fork(); run app.py directly on this platform')
+    args = parse_args()
+    run(args.host, args.port, max(1, args.workers), args.report_delay)
@@ -27,6 +27,9 @@ Copy-Item "README_HF.md" "$hfFolder/README.md"
 
 Write-Host "[5/6] Copying utility files..." -ForegroundColor Yellow
 Copy-Item "util.py" "$hfFolder/"
+Copy-Item "memory.py" "$hfFolder/"
+Copy-Item "ocr.py" "$hfFolder/"
+Copy-Item "plate_formats.py" "$hfFolder/"
 if (Test-Path "license_plate_detector.pt") {
     Copy-Item "license_plate_detector.pt" "$hfFolder/"
     Write-Host "   - license_plate_detector.pt copied" -ForegroundColor Green
@@ -0,0 +1,219 @@
+"""
+Opt-in profiling of a processing run.
+
+A Profiler records nested timing spans (the whole job, each frame, and each
+stage inside a frame) from every thread it is activated on, and writes them
+as a Chrome trace (open trace.json in chrome://tracing or ui.perfetto.dev)
+plus a summary table of the most expensive stages by total and p95 time.
+
+Enable it for every job with ANPR_PROFILE=1, for one upload with the
+`profile=1` form field, or profile a single video from the command line:
+
+    python profiling.py video.mp4 --output profile_run
+"""
+import argparse
+import json
+import math
+import os
+import threading
+import time
+
+TRACE_NAME = 'trace.json'
+SUMMARY_NAME = 'profile_summary.txt'
+
+_local = threading.local()
+
+
+def enabled_by_env():
+    """Whether ANPR_PROFILE asks for every job to be profiled"""
+    return os.environ.get('ANPR_PROFILE') == '1'
+
+
+def activate(profiler):
+    """
+    Make `profiler` receive the spans opened on the calling thread.
+
+    Args:
+        profiler (Profiler): Profiler to activate, or None to deactivate.
+
+    Returns:
+        Profiler: The previously active profiler, to restore with activate(previous).
+    """
+    previous = getattr(_local, 'profiler', None)
+    _local.profiler = profiler
+    return previous
+
+
+class _NoSpan(object):
+    """Span used when no profiler is active on the thread; costs one attribute lookup"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+
+_NO_SPAN = _NoSpan()
+
+
+class _Span(object):
+    __slots__ = ('profiler', 'name', 'args', 'started_at')
+
+    def __init__(self, profiler, name, args):
+        self.profiler = profiler
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.started_at = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.profiler.add(self.name, self.started_at, time.perf_counter(), self.args)
+
+
+def span(name, **args):
+    """
+    Time a block as a span of the profiler active on this thread, if any.
+
+    Args:
+        name (str): Stage name.
+        **args: Extra values shown with the span in the trace viewer.
+    """
+    profiler = getattr(_local, 'profiler', None)
+    if profiler is None:
+        return _NO_SPAN
+    return _Span(profiler, name, args or None)
+
+
+def record(name, started_at, finished_at, **args):
+    """Add an already-timed span (time.perf_counter() values) to the active profiler, if any"""
+    profiler = getattr(_local, 'profiler', None)
+    if profiler is not None:
+        profiler.add(name, started_at, finished_at, args or None)
+
+
+def _percentile(sorted_values, fraction):
+    return sorted_values[max(0, int(math.ceil(fraction * len(sorted_values))) - 1)]
+
+
+class Profiler(object):
+    """
+    Collect spans and write them as a Chrome trace.
+
+    Args:
+        name (str): Process name shown in the trace viewer.
+    """
+
+    def __init__(self, name='anpr'):
+        self.name = name
+        self._origin = time.perf_counter()
+        self._events = []
+        self._threads = {}
+
+    def add(self, name, started_at, finished_at, args=None):
+        """Record a finished span; times are time.perf_counter() values"""
+        tid = threading.get_ident()
+        if tid not in self._threads:
+            self._threads[tid] = threading.current_thread().name
+        # list.append is atomic, no lock needed on the hot path
+        self._events.append((name, started_at, finished_at - started_at, tid, args))
+
+    def trace(self):
+        """The recorded spans as a Chrome trace event dict"""
+        pid = os.getpid()
+        events = [{'name': 'process_name', 'ph': 'M', 'pid': pid, 'tid': 0, 'args': {'name': self.name}}]
+        for tid, thread_name in list(self._threads.items()):
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': thread_name}})
+        for name, started_at, duration, tid, args in list(self._events):
+            event = {
+                'name': name,
+                'ph': 'X',
+                'ts': round((started_at - self._origin) * 1e6, 1),
+                'dur': round(duration * 1e6, 1),
+                'pid': pid,
+                'tid': tid,
+            }
+            if args:
+                event['args'] = args
+            events.append(event)
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def summary(self, top=15):
+        """
+        Aggregate span durations per stage.
+
+        Args:
+            top (int): Number of stages to return.
+
+        Returns:
+            list: Dicts with name, count, total_s, mean_ms, p95_ms and max_ms, largest total first.
+        """
+        durations = {}
+        for name, _, duration, _, _ in list(self._events):
+            durations.setdefault(name, []).append(duration)
+        rows = []
+        for name, values in durations.items():
+            values.sort()
+            total = sum(values)
+            rows.append({
+                'name': name,
+                'count': len(values),
+                'total_s': round(total, 4),
+                'mean_ms': round(total / len(values) * 1000, 3),
+                'p95_ms': round(_percentile(values, 0.95) * 1000, 3),
+                'max_ms': round(values[-1] * 1000, 3),
+            })
+        rows.sort(key=lambda row: row['total_s'], reverse=True)
+        return rows[:top]
+
+    def format_summary(self, top=15):
+        """Summary as two text tables: top stages by total time and by p95"""
+        rows = self.summary(top=len(self._events) or 1)
+        header = f"{'stage':<24}{'count':>8}{'total s':>11}{'mean ms':>11}{'p95 ms':>11}{'max ms':>11}"
+
+        def table(title, ordered):
+            lines = [title, header, '-' * len(header)]
+            for row in ordered[:top]:
+                lines.append(f"{row['name']:<24}{row['count']:>8}{row['total_s']:>11.3f}{row['mean_ms']:>11.3f}"
+                             f"{row['p95_ms']:>11.3f}{row['max_ms']:>11.3f}")
+            return lines
+
+        lines = table('Top stages by total time', rows)
+        lines.append('')
+        lines.extend(table('Top stages by p95 time', sorted(rows, key=lambda row: row['p95_ms'], reverse=True)))
+        return '\n'.join(lines)
+
+    def save(self, folder):
+        """
+        Write trace.json and profile_summary.txt into folder and print the summary.
+
+        Returns:
+            dict: {'trace': path, 'profile_summary': path}
+        """
+        trace_path = os.path.join(folder, TRACE_NAME)
+        summary_path = os.path.join(folder, SUMMARY_NAME)
+        with open(trace_path, 'w') as f:
+            json.dump(self.trace(), f)
+        summary = self.format_summary()
+        with open(summary_path, 'w') as f:
+            f.write(summary + '\n')
+        print(summary)
+        return {'trace': trace_path, 'profile_summary': summary_path}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Process one video with profiling and write a Chrome trace')
+    parser.add_argument('video', help='Video to process')
+    parser.add_argument('--output', default='profile_run', help='Output folder [profile_run]')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    os.makedirs(args.output, exist_ok=True)
+    from pipeline import process_video
+
+    result = process_video(args.video, args.output, profile=True)
+    print(f"Chrome trace written to {result['trace']}")
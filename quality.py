@@ -0,0 +1,141 @@
+"""
+Plate crop quality gate in front of OCR.
+
+Most plate crops in a video are too small, blurred by motion or washed out
+to produce a valid reading. A QualityGate scores each crop on size, aspect
+ratio, contrast and sharpness (variance of the Laplacian); crops below the
+thresholds skip OCR. Per track it also keeps the sharpness of the crops read
+so far and only sends a new crop to OCR when it is among the top_k sharpest
+seen. Frames whose crop is skipped reuse the track's consensus reading (see
+consensus.py), so the CSV and the rendered video keep a box and text on
+every frame.
+
+ANPR_QUALITY_GATE=0 turns the gate off; ANPR_OCR_TOP_K sets top_k (0 = no
+per-track limit).
+"""
+import bisect
+import os
+
+import cv2
+
+import metrics
+
+QUALITY_GATE = os.environ.get('ANPR_QUALITY_GATE', '1') == '1'
+OCR_TOP_K = int(os.environ.get('ANPR_OCR_TOP_K', 3))
+
+_SKIPPED_QUALITY = metrics.OCR_SKIPPED.labels('quality')
+_SKIPPED_TOP_K = metrics.OCR_SKIPPED.labels('top_k')
+
+
+def crop_quality(gray):
+    """
+    Cheap quality measures of a grayscale plate crop.
+
+    Returns:
+        dict: width, height, aspect (width / height), contrast (standard deviation
+            of the pixel values) and sharpness (variance of the Laplacian).
+    """
+    height, width = gray.shape[:2]
+    _, std = cv2.meanStdDev(gray)
+    _, laplacian_std = cv2.meanStdDev(cv2.Laplacian(gray, cv2.CV_32F))
+    return {
+        'width': width,
+        'height': height,
+        'aspect': width / float(height) if height else 0.0,
+        'contrast': float(std[0, 0]),
+        'sharpness': float(laplacian_std[0, 0]) ** 2,
+    }
+
+
+class QualityGate(object):
+    """
+    Decide which plate crops of a video or stream are worth reading.
+
+    Args:
+        top_k (int): OCR calls per track, kept for its sharpest crops. 0 = unlimited.
+        min_width (int): Smallest crop width in pixels.
+        min_height (int): Smallest crop height in pixels.
+        min_aspect (float): Lowest width / height; square plates are about 1.5.
+        max_aspect (float): Highest width / height; long single-line plates are about 5.
+        min_contrast (float): Lowest standard deviation of the grayscale pixels.
+        min_sharpness (float): Lowest variance of the Laplacian.
+        max_idle (int): Frames after which a track that wasn't seen is forgotten.
+    """
+
+    def __init__(self, top_k=OCR_TOP_K, min_width=30, min_height=10, min_aspect=1.2, max_aspect=8.0,
+                 min_contrast=15.0, min_sharpness=30.0, max_idle=30):
+        self.top_k = top_k
+        self.min_width = min_width
+        self.min_height = min_height
+        self.min_aspect = min_aspect
+        self.max_aspect = max_aspect
+        self.min_contrast = min_contrast
+        self.min_sharpness = min_sharpness
+        self.max_idle = max_idle
+        # car_id -> sorted sharpness of the crops sent to OCR and last frame seen
+        self._tracks = {}
+        self.crops = 0
+        self.ocr_calls = 0
+        self.skipped_quality = 0
+        self.skipped_top_k = 0
+
+    def _track(self, car_id, frame_nmr):
+        track = self._tracks.get(car_id)
+        if track is None:
+            track = self._tracks[car_id] = {'sharpness': [], 'seen': frame_nmr}
+        track['seen'] = frame_nmr
+        return track
+
+    def passes(self, quality):
+        """Whether a crop's quality measures clear every threshold"""
+        return (quality['width'] >= self.min_width and quality['height'] >= self.min_height and
+                self.min_aspect <= quality['aspect'] <= self.max_aspect and
+                quality['contrast'] >= self.min_contrast and quality['sharpness'] >= self.min_sharpness)
+
+    def admit(self, car_id, frame_nmr, gray):
+        """
+        Decide whether to run OCR on a crop.
+
+        Args:
+            car_id (int): Track the plate belongs to.
+            frame_nmr (int): Frame the crop comes from.
+            gray (numpy.ndarray): Grayscale plate crop.
+
+        Returns:
+            bool: True to run OCR, False to skip it.
+        """
+        self.crops += 1
+        track = self._track(car_id, frame_nmr)
+        quality = crop_quality(gray)
+        if not self.passes(quality):
+            self.skipped_quality += 1
+            _SKIPPED_QUALITY.inc()
+            return False
+
+        kept = track['sharpness']
+        if self.top_k:
+            if len(kept) >= self.top_k:
+                if quality['sharpness'] <= kept[0]:
+                    self.skipped_top_k += 1
+                    _SKIPPED_TOP_K.inc()
+                    return False
+                kept.pop(0)
+            bisect.insort(kept, quality['sharpness'])
+        self.ocr_calls += 1
+        return True
+
+    def end_frame(self, frame_nmr):
+        """Forget tracks that haven't had a plate for max_idle frames"""
+        if frame_nmr % self.max_idle == 0:
+            for car_id in [car_id for car_id, track in self._tracks.items()
+                           if frame_nmr - track['seen'] > self.max_idle]:
+                del self._tracks[car_id]
+
+    def stats(self):
+        return {
+            'crops': self.crops,
+            'ocr_calls': self.ocr_calls,
+            'skipped_quality': self.skipped_quality,
+            'skipped_top_k': self.skipped_top_k,
+            'ocr_calls_avoided': self.skipped_quality + self.skipped_top_k,
+        }
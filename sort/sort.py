@@ -19,11 +19,6 @@ from __future__ import print_function
 
 import os
 import numpy as np
-import matplotlib
-matplotlib.use('Agg')  # Use non-GUI backend (changed from TkAgg)
-import matplotlib.pyplot as plt
-import matplotlib.patches as patches
-from skimage import io
 
 import glob
 import time
@@ -207,6 +202,20 @@ class Sort(object):
     self.trackers = []
     self.frame_count = 0
 
+  def __getstate__(self):
+    """
+    Pickle support for checkpoints: also records the global track ID counter
+    """
+    state = self.__dict__.copy()
+    state['next_track_id'] = KalmanBoxTracker.count
+    return state
+
+  def __setstate__(self, state):
+    state = dict(state)
+    # never hand out an ID that the restored tracks may already use
+    KalmanBoxTracker.count = max(KalmanBoxTracker.count, state.pop('next_track_id', 0))
+    self.__dict__.update(state)
+
   def update(self, dets=np.empty((0, 5))):
     """
     Params:
@@ -216,6 +225,8 @@ class Sort(object):
 
     NOTE: The number of objects returned may differ from the number of detections provided.
     """
+    # An empty list (no vehicles in the frame) arrives as shape (0,); iou_batch needs (0, 5)
+    dets = np.asarray(dets, dtype=float).reshape(-1, 5)
     self.frame_count += 1
     # get predicted locations from existing trackers.
     trks = np.zeros((len(self.trackers), 5))
@@ -277,6 +288,12 @@ if __name__ == '__main__':
   total_frames = 0
   colours = np.random.rand(32, 3) #used only for display
   if(display):
+    # Plotting is only needed for the demo display; the tracker itself doesn't import it
+    import matplotlib
+    matplotlib.use('Agg')  # Use non-GUI backend (changed from TkAgg)
+    import matplotlib.pyplot as plt
+    import matplotlib.patches as patches
+    from skimage import io
     if not os.path.exists('mot_benchmark'):
       print('\n\tERROR: mot_benchmark link not found!\n\n    Create a symbolic link to the MOT benchmark\n    (https://motchallenge.net/data/2D_MOT_2015/#download). E.g.:\n\n    $ ln -s /path/to/MOT2015_challenge/2DMOT2015 mot_benchmark\n\n')
       exit()
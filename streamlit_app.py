@@ -250,19 +250,22 @@ def main():
         )
         
         if uploaded_file is not None:
-            # Save uploaded file
+            # Save uploaded file in chunks; processing reads it back from disk
+            uploaded_file.seek(0)
             with tempfile.NamedTemporaryFile(delete=False, suffix=Path(uploaded_file.name).suffix) as tmp_file:
-                tmp_file.write(uploaded_file.read())
+                _, upload_peak_rss = util.save_upload(uploaded_file, tmp_file)
                 video_path = tmp_file.name
             
             st.success(f"✅ File uploaded: {uploaded_file.name}")
             
             # Display video info
-            col1, col2 = st.columns(2)
+            col1, col2, col3 = st.columns(3)
             with col1:
                 st.metric("File Size", f"{uploaded_file.size / (1024*1024):.2f} MB")
             with col2:
                 st.metric("Format", Path(uploaded_file.name).suffix.upper())
+            with col3:
+                st.metric("Peak RSS (upload)", f"{upload_peak_rss:.0f} MB")
             
             # Process button
             if st.button("🚀 Start Processing", type="primary"):
@@ -0,0 +1,121 @@
+"""
+Per-track summary of a processed video.
+
+results.csv has one row per car per frame. TrackSummary folds those rows
+into one record per track as frames are processed, so finishing a job only
+writes a short tracks.csv: first and last frame, plate text and score, the
+best plate box and the average speed. Consumers that just need the list of
+vehicles read that file instead of the per-frame rows.
+"""
+import math
+
+SUMMARY_NAME = 'tracks.csv'
+
+COLUMNS = ('car_id', 'first_frame', 'last_frame', 'frames', 'license_number', 'license_number_score',
+           'best_frame', 'best_license_plate_bbox', 'best_car_bbox', 'speed_px_per_frame')
+
+
+class _Track(object):
+    __slots__ = ('first_frame', 'last_frame', 'frames', 'text', 'text_score', 'best_frame', 'best_rank',
+                 'best_plate_bbox', 'best_car_bbox', 'last_center', 'distance')
+
+    def __init__(self, frame_nmr):
+        self.first_frame = frame_nmr
+        self.last_frame = frame_nmr
+        self.frames = 0
+        self.text = None
+        self.text_score = None
+        self.best_frame = None
+        self.best_rank = -1.0
+        self.best_plate_bbox = None
+        self.best_car_bbox = None
+        self.last_center = None
+        self.distance = 0.0
+
+
+class TrackSummary(object):
+    """Incremental per-track aggregate of a video's results"""
+
+    def __init__(self):
+        self._tracks = {}
+
+    def __len__(self):
+        return len(self._tracks)
+
+    def add(self, frame_nmr, frame_results):
+        """
+        Fold one frame's results in; frames must arrive in increasing order.
+
+        Args:
+            frame_nmr (int): Frame number.
+            frame_results (dict): {car_id: {'car': {...}, 'license_plate': {...}}} from process_frame.
+
+        Returns:
+            list: car_ids whose best plate crop is now in this frame.
+        """
+        improved = []
+        for car_id, result in frame_results.items():
+            track = self._tracks.get(car_id)
+            if track is None:
+                track = self._tracks[car_id] = _Track(frame_nmr)
+            track.last_frame = frame_nmr
+            track.frames += 1
+
+            plate = result['license_plate']
+            track.text, track.text_score = plate['text'], plate['text_score']
+
+            x1, y1, x2, y2 = plate['bbox']
+            # The largest, most confidently detected plate box gives the most legible crop
+            rank = max(0.0, x2 - x1) * max(0.0, y2 - y1) * float(plate['bbox_score'])
+            if rank > track.best_rank:
+                track.best_rank = rank
+                track.best_frame = frame_nmr
+                track.best_plate_bbox = list(plate['bbox'])
+                track.best_car_bbox = list(result['car']['bbox'])
+                improved.append(car_id)
+
+            cx1, cy1, cx2, cy2 = result['car']['bbox']
+            center = ((cx1 + cx2) / 2.0, (cy1 + cy2) / 2.0)
+            if track.last_center is not None:
+                track.distance += math.hypot(center[0] - track.last_center[0], center[1] - track.last_center[1])
+            track.last_center = center
+        return improved
+
+    def set_plate(self, car_id, text, score):
+        """Replace a track's plate reading, e.g. with its final consensus"""
+        track = self._tracks.get(car_id)
+        if track is not None:
+            track.text, track.text_score = text, score
+
+    def rows(self):
+        """One dict per track with COLUMNS as keys, in order of first appearance"""
+        rows = []
+        for car_id, track in sorted(self._tracks.items(), key=lambda item: (item[1].first_frame, item[0])):
+            span = track.last_frame - track.first_frame
+            rows.append({
+                'car_id': int(car_id),
+                'first_frame': track.first_frame,
+                'last_frame': track.last_frame,
+                'frames': track.frames,
+                'license_number': track.text,
+                'license_number_score': track.text_score,
+                'best_frame': track.best_frame,
+                'best_license_plate_bbox': track.best_plate_bbox,
+                'best_car_bbox': track.best_car_bbox,
+                'speed_px_per_frame': round(track.distance / span, 3) if span else 0.0,
+            })
+        return rows
+
+    def write(self, path):
+        """Write tracks.csv in the style of results.csv ('[x1 y1 x2 y2]' boxes) and return the path"""
+        with open(path, 'w') as f:
+            f.write(','.join(COLUMNS) + '\n')
+            for row in self.rows():
+                values = []
+                for column in COLUMNS:
+                    value = row[column]
+                    if isinstance(value, list):
+                        value = '[{} {} {} {}]'.format(*value)
+                    values.append('' if value is None else str(value))
+                f.write(','.join(values) + '\n')
+        return path
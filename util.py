@@ -1,13 +1,26 @@
-import string
 import os
 import re
+import threading
+
+import numpy as np
+
+from memory import RssTracker
+
+# Uploads are copied to disk in chunks of this size instead of read() in one go
+UPLOAD_CHUNK_SIZE = 1024 * 1024
 
 # Lazy load easyocr to speed up cold starts and save memory
 _reader = None
 _ocr_available = True
+# The background warm-up and the first job may ask for the reader at the same time
+_reader_lock = threading.Lock()
 
 def get_ocr_reader():
     """Lazy load OCR reader - returns None if EasyOCR not installed"""
+    with _reader_lock:
+        return _get_ocr_reader()
+
+def _get_ocr_reader():
     global _reader, _ocr_available
     if _reader is None and _ocr_available:
         try:
@@ -17,11 +30,11 @@ def get_ocr_reader():
             _reader = easyocr.Reader(['en'], gpu=False, verbose=False, download_enabled=True)
             print("EasyOCR reader initialized")
         except ImportError:
-            print("⚠️ EasyOCR not installed - using pattern matching for license plates")
+            print("⚠️ EasyOCR not installed - using the template OCR engine for license plates")
             _ocr_available = False
             _reader = None
         except Exception as e:
-            print(f"⚠️ Error loading EasyOCR: {e} - using pattern matching")
+            print(f"⚠️ Error loading EasyOCR: {e} - using the template OCR engine")
             _ocr_available = False
             _reader = None
     return _reader
@@ -42,6 +55,48 @@ dict_int_to_char = {'0': 'O',
                     '5': 'S'}
 
 
+class _Boxes(object):
+    def __init__(self, data):
+        self.data = data
+
+
+class DetectionResult(object):
+    """
+    Minimal stand-in for an ultralytics Results object.
+
+    Exposes `boxes.data` as an (N, 6) array of [x1, y1, x2, y2, score, class_id]
+    so detectors that are not YOLO models can be used by the pipeline.
+    """
+
+    def __init__(self, rows):
+        self.boxes = _Boxes(np.asarray(rows, dtype=np.float32).reshape(-1, 6))
+
+
+def save_upload(src, dst, chunk_size=UPLOAD_CHUNK_SIZE):
+    """
+    Stream an uploaded file object to disk in fixed-size chunks.
+
+    Args:
+        src (file-like): Uploaded file, read from its current position.
+        dst (file-like): Binary file object to write to.
+        chunk_size (int): Bytes copied per read.
+
+    Returns:
+        tuple: Number of bytes written and the peak RSS (MB) seen while copying.
+    """
+    rss = RssTracker()
+    written = 0
+    while True:
+        chunk = src.read(chunk_size)
+        if not chunk:
+            break
+        dst.write(chunk)
+        written += len(chunk)
+        rss.sample()
+    dst.flush()
+    return written, rss.peak_mb
+
+
 def write_csv(results, output_path):
     """
     Write the results to a CSV file.
@@ -82,7 +137,8 @@ def write_csv(results, output_path):
 
 def license_complies_format(text):
     """
-    Check if the license plate text complies with the required format.
+    Check if the license plate text complies with one of the active plate formats
+    (ANPR_PLATE_FORMATS, see plate_formats.py).
 
     Args:
         text (str): License plate text.
@@ -90,19 +146,9 @@ def license_complies_format(text):
     Returns:
         bool: True if the license plate complies with the format, False otherwise.
     """
-    if len(text) != 7:
-        return False
+    from plate_formats import get_matcher
 
-    if (text[0] in string.ascii_uppercase or text[0] in dict_int_to_char.keys()) and \
-       (text[1] in string.ascii_uppercase or text[1] in dict_int_to_char.keys()) and \
-       (text[2] in ['0', '1', '2', '3', '4', '5', '6', '7', '8', '9'] or text[2] in dict_char_to_int.keys()) and \
-       (text[3] in ['0', '1', '2', '3', '4', '5', '6', '7', '8', '9'] or text[3] in dict_char_to_int.keys()) and \
-       (text[4] in string.ascii_uppercase or text[4] in dict_int_to_char.keys()) and \
-       (text[5] in string.ascii_uppercase or text[5] in dict_int_to_char.keys()) and \
-       (text[6] in string.ascii_uppercase or text[6] in dict_int_to_char.keys()):
-        return True
-    else:
-        return False
+    return get_matcher().match([(text, 1.0)]) is not None
 
 
 def format_license(text):
@@ -113,24 +159,18 @@ def format_license(text):
         text (str): License plate text.
 
     Returns:
-        str: Formatted license plate text.
+        str: Formatted license plate text, or the text unchanged if it fits no active format.
     """
-    license_plate_ = ''
-    mapping = {0: dict_int_to_char, 1: dict_int_to_char, 4: dict_int_to_char, 5: dict_int_to_char, 6: dict_int_to_char,
-               2: dict_char_to_int, 3: dict_char_to_int}
-    for j in [0, 1, 2, 3, 4, 5, 6]:
-        if text[j] in mapping[j].keys():
-            license_plate_ += mapping[j][text[j]]
-        else:
-            license_plate_ += text[j]
+    from plate_formats import get_matcher
 
-    return license_plate_
+    match = get_matcher().match([(text, 1.0)])
+    return match[0] if match is not None else text
 
 
 def read_license_plate(license_plate_crop):
     """
-    Read the license plate text from the given cropped image.
-    Falls back to placeholder if OCR not available.
+    Read the license plate text from the given cropped image with the OCR
+    engine selected by ANPR_OCR_ENGINE (see ocr.py).
 
     Args:
         license_plate_crop (PIL.Image.Image): Cropped image containing the license plate.
@@ -138,40 +178,9 @@ def read_license_plate(license_plate_crop):
     Returns:
         tuple: Tuple containing the formatted license plate text and its confidence score.
     """
-    reader = get_ocr_reader()
-    
-    # If OCR not available, return placeholder
-    if reader is None:
-        # Generate a unique placeholder based on image hash
-        import hashlib
-        import cv2
-        import numpy as np
-        
-        try:
-            # Convert to bytes for hashing
-            img_bytes = cv2.imencode('.jpg', license_plate_crop)[1].tobytes()
-            hash_val = hashlib.md5(img_bytes).hexdigest()[:6].upper()
-            placeholder = f"LP{hash_val}"
-            return placeholder, 0.5  # Medium confidence for placeholder
-        except:
-            return "LPUNK", 0.3  # Unknown plate
-    
-    # Use OCR if available
-    try:
-        detections = reader.readtext(license_plate_crop)
-
-        for detection in detections:
-            bbox, text, score = detection
-
-            text = text.upper().replace(' ', '')
-
-            if license_complies_format(text):
-                return format_license(text), score
-    except Exception as e:
-        print(f"OCR error: {e}")
-        return "LPERR", 0.2
-
-    return None, None
+    from ocr import get_engine
+
+    return get_engine().read(license_plate_crop)
 
 
 def get_car(license_plate, vehicle_track_ids):
@@ -0,0 +1,182 @@
+"""
+Threaded frame source for the ANPR pipeline.
+
+Frames are decoded on a background thread into a small bounded ring buffer so
+decoding overlaps with detection. Each frame is handed out at full resolution
+(for plate crops / OCR) together with a downscaled copy for the YOLO detectors,
+which resize to 640px internally anyway.
+"""
+import collections
+import threading
+import time
+
+import cv2
+
+import metrics
+import profiling
+
+
+class Frame(object):
+    """A decoded frame plus its downscaled detection copy"""
+    __slots__ = ('index', 'image', 'small', 'scale')
+
+    def __init__(self, index, image, small, scale):
+        self.index = index
+        self.image = image
+        self.small = small
+        self.scale = scale
+
+    def full_res_boxes(self, rows):
+        """
+        Map detector rows computed on `small` back to full-resolution coordinates.
+
+        Args:
+            rows (list): Rows in the form [x1, y1, x2, y2, score, class_id].
+
+        Returns:
+            list: Rows with the box coordinates rescaled to `image`.
+        """
+        if self.scale == 1.0:
+            return rows
+        inv = 1.0 / self.scale
+        return [[x1 * inv, y1 * inv, x2 * inv, y2 * inv] + list(rest) for x1, y1, x2, y2, *rest in rows]
+
+
+def make_frame(index, image, detect_size):
+    """
+    Wrap a decoded image in a Frame with a copy downscaled for detection.
+
+    Args:
+        index (int): Frame number.
+        image (numpy.ndarray): Full-resolution BGR image.
+        detect_size (int): Longest side of the detection copy. 0 disables downscaling.
+
+    Returns:
+        Frame: The wrapped frame.
+    """
+    height, width = image.shape[:2]
+    longest = max(height, width)
+    if not detect_size or longest <= detect_size:
+        return Frame(index, image, image, 1.0)
+    scale = detect_size / float(longest)
+    small = cv2.resize(image, (int(round(width * scale)), int(round(height * scale))),
+                       interpolation=cv2.INTER_AREA)
+    return Frame(index, image, small, scale)
+
+
+class FrameSource(object):
+    """
+    Decode a video on a background thread into a bounded ring buffer.
+
+    Args:
+        video_path (str): Path of the video to read.
+        detect_size (int): Longest side of the downscaled detection copy. 0 disables downscaling.
+        buffer_size (int): Maximum number of decoded frames held ahead of the consumer.
+        start_frame (int): First frame to emit. Seeks instead of decoding from frame 0.
+        end_frame (int): Frame index to stop before, or None for the whole video.
+        profiler (profiling.Profiler): Receives a 'decode' span per frame, or None.
+    """
+
+    def __init__(self, video_path, detect_size=640, buffer_size=8, start_frame=0, end_frame=None, profiler=None):
+        self.video_path = video_path
+        # Read on every frame so they can be tuned while a video is running
+        self.detect_size = detect_size
+        self.buffer_size = buffer_size
+        self.start_frame = max(0, int(start_frame))
+        self.end_frame = end_frame
+        self.profiler = profiler
+
+        self._cap = cv2.VideoCapture(video_path)
+        self.total_frames = int(self._cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.fps = self._cap.get(cv2.CAP_PROP_FPS)
+        self.width = int(self._cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height = int(self._cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+        self._buffer = collections.deque()
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._finished = False
+        self._error = None
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='frame-decoder', daemon=True)
+            self._thread.start()
+        return self
+
+    def close(self):
+        with self._cond:
+            self._stopped = True
+            self._buffer.clear()
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._cap is not None:
+            self._cap.release()
+            self._cap = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __iter__(self):
+        self.start()
+        while True:
+            with self._cond:
+                while not self._buffer and not self._finished and not self._stopped:
+                    self._cond.wait()
+                if self._buffer:
+                    frame = self._buffer.popleft()
+                    self._cond.notify_all()
+                elif self._error is not None:
+                    raise self._error
+                else:
+                    return
+            yield frame
+
+    def _seek(self, frame_nmr):
+        """Position the capture at frame_nmr, falling back to grab() when seeking is unsupported"""
+        if frame_nmr == 0:
+            return
+        if self._cap.set(cv2.CAP_PROP_POS_FRAMES, frame_nmr) and \
+           int(self._cap.get(cv2.CAP_PROP_POS_FRAMES)) == frame_nmr:
+            return
+        # grab() skips the colour conversion so this is still much cheaper than read()
+        self._cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        for _ in range(frame_nmr):
+            if not self._cap.grab():
+                break
+
+    def _run(self):
+        profiling.activate(self.profiler)
+        try:
+            with profiling.span('seek', frame=self.start_frame):
+                self._seek(self.start_frame)
+            frame_nmr = self.start_frame
+            while self.end_frame is None or frame_nmr < self.end_frame:
+                started_at = time.perf_counter()
+                ret, image = self._cap.read()
+                if not ret:
+                    break
+                frame = make_frame(frame_nmr, image, self.detect_size)
+                finished_at = time.perf_counter()
+                metrics.DECODE.observe(finished_at - started_at)
+                profiling.record('decode', started_at, finished_at, frame=frame_nmr)
+                with self._cond:
+                    while len(self._buffer) >= max(1, self.buffer_size) and not self._stopped:
+                        self._cond.wait()
+                    if self._stopped:
+                        return
+                    self._buffer.append(frame)
+                    self._cond.notify_all()
+                frame_nmr += 1
+        except Exception as e:
+            self._error = e
+        finally:
+            with self._cond:
+                self._finished = True
+                self._cond.notify_all()
@@ -0,0 +1,92 @@
+"""
+Annotated video output.
+
+When an ffmpeg binary is available, frames are piped to it and encoded as
+H.264 fragmented MP4, which browsers play inline and can seek into with HTTP
+range requests while the file is served. Without ffmpeg we fall back to
+OpenCV's XVID AVI writer.
+"""
+import os
+import shutil
+import subprocess
+
+import cv2
+
+# Keyframe (and therefore fragment) interval in seconds; bounds how far a seek has to decode
+FRAGMENT_SECONDS = 2
+
+
+def ffmpeg_path():
+    """Path of the ffmpeg binary (ANPR_FFMPEG overrides PATH lookup), or None"""
+    return os.environ.get('ANPR_FFMPEG') or shutil.which('ffmpeg')
+
+
+def output_extension():
+    """Extension of the annotated video this environment can produce"""
+    return '.mp4' if ffmpeg_path() else '.avi'
+
+
+class FFmpegWriter(object):
+    """
+    Encode BGR frames to H.264 fragmented MP4 through an ffmpeg subprocess.
+
+    Has the same write()/release() interface as cv2.VideoWriter.
+    """
+
+    def __init__(self, path, fps, size, crf=23, preset='veryfast'):
+        width, height = size
+        fps = fps if fps and fps > 0 else 25.0
+        self.path = path
+        self.size = (width, height)
+        cmd = [
+            ffmpeg_path(), '-hide_banner', '-loglevel', 'error', '-y',
+            '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', f'{width}x{height}', '-r', f'{fps:.3f}',
+            '-i', '-',
+            '-an', '-c:v', 'libx264', '-preset', preset, '-crf', str(crf),
+            # yuv420p needs even dimensions
+            '-vf', 'scale=trunc(iw/2)*2:trunc(ih/2)*2', '-pix_fmt', 'yuv420p',
+            '-g', str(max(1, int(round(fps * FRAGMENT_SECONDS)))),
+            '-movflags', 'frag_keyframe+empty_moov+default_base_moof',
+            path,
+        ]
+        self._proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def isOpened(self):
+        return self._proc is not None and self._proc.poll() is None
+
+    def write(self, frame):
+        try:
+            self._proc.stdin.write(frame.tobytes())
+        except BrokenPipeError:
+            self.release()
+
+    def release(self):
+        if self._proc is None:
+            return
+        proc, self._proc = self._proc, None
+        try:
+            proc.stdin.close()
+        except BrokenPipeError:
+            pass
+        errors = proc.stderr.read()
+        proc.wait()
+        if proc.returncode != 0:
+            raise RuntimeError(f"ffmpeg exited with {proc.returncode}: {errors.decode(errors='replace').strip()}")
+
+
+def open_video_writer(path, fps, size):
+    """
+    Open a writer for annotated output.
+
+    Args:
+        path (str): Output path; '.mp4' selects ffmpeg, anything else OpenCV XVID.
+        fps (float): Frame rate of the input video.
+        size (tuple): (width, height) of the frames that will be written.
+
+    Returns:
+        object: A writer with write(frame) and release().
+    """
+    if path.endswith('.mp4') and ffmpeg_path():
+        return FFmpegWriter(path, fps, size)
+    fourcc = cv2.VideoWriter_fourcc(*'XVID')
+    return cv2.VideoWriter(path, fourcc, fps, size)
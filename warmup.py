@@ -0,0 +1,112 @@
+"""
+Background warm-up of the processing engine.
+
+Loading the YOLO weights and the EasyOCR reader takes seconds, and the first
+inference through each model allocates buffers and builds its predictor.
+Warming up at startup moves that cost off the first user's request: every
+component is loaded and run once on a dummy input, with per-step timings
+kept for /ready and the startup log.
+"""
+import contextlib
+import threading
+import time
+
+
+def _dummy_frame(size):
+    """A mid-grey frame with a white plate-like box carrying dark text"""
+    import cv2
+    import numpy as np
+
+    frame = np.full((size, size, 3), 127, dtype=np.uint8)
+    x1, y1 = size // 2 - 100, size // 2 - 25
+    cv2.rectangle(frame, (x1, y1), (x1 + 200, y1 + 50), (255, 255, 255), -1)
+    cv2.putText(frame, 'AB12CDE', (x1 + 10, y1 + 38), cv2.FONT_HERSHEY_SIMPLEX, 1.1, (0, 0, 0), 3)
+    return frame, (x1, y1, x1 + 200, y1 + 50)
+
+
+class WarmUp(object):
+    """
+    Load and exercise the detectors and the OCR reader once.
+
+    Args:
+        use_server (bool): Passed to pipeline.load_models; False forces local models.
+    """
+
+    def __init__(self, use_server=True):
+        self.use_server = use_server
+        self.status = 'idle'
+        self.error = None
+        self.timings = {}
+        self.started_at = None
+        self.finished_at = None
+        self._thread = None
+
+    def start(self):
+        """Run the warm-up on a background thread"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run, name='warm-up', daemon=True)
+            self._thread.start()
+        return self
+
+    def wait(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return self.status == 'done'
+
+    def run(self):
+        """
+        Run every warm-up step in the calling thread.
+
+        Returns:
+            dict: Seconds spent in each step that ran.
+        """
+        self.status = 'running'
+        self.started_at = time.time()
+        try:
+            with self._step('import_engine'):
+                import pipeline
+                from ocr import get_engine
+            with self._step('load_detectors'):
+                coco_model, license_plate_detector = pipeline.load_models(use_server=self.use_server)
+
+            frame, plate_box = _dummy_frame(pipeline.DETECT_SIZE)
+            with self._step('vehicle_detector_inference'):
+                with pipeline._inference_lock:
+                    coco_model(frame)
+            with self._step('plate_detector_inference'):
+                with pipeline._inference_lock:
+                    license_plate_detector(frame)
+
+            # Behind a model server the reader lives in the server process
+            if pipeline._plate_ocr is pipeline.read_license_plate:
+                with self._step('ocr_reader_load'):
+                    get_engine().load()
+            with self._step('ocr_inference'):
+                pipeline.read_plate(frame, *plate_box)
+            self.status = 'done'
+        except Exception as e:
+            self.status = 'failed'
+            self.error = str(e)
+            print(f"Warm-up failed: {e}")
+        finally:
+            self.finished_at = time.time()
+        print(f"Warm-up {self.status} in {self.finished_at - self.started_at:.2f}s: " +
+              ', '.join(f'{step} {seconds:.2f}s' for step, seconds in self.timings.items()))
+        return self.timings
+
+    @contextlib.contextmanager
+    def _step(self, name):
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = time.perf_counter() - started_at
+
+    def to_dict(self):
+        return {
+            'status': self.status,
+            'error': self.error,
+            'seconds': round(self.finished_at - self.started_at, 3) if self.finished_at else None,
+            'steps': {step: round(seconds, 3) for step, seconds in self.timings.items()},
+        }
+
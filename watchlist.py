@@ -0,0 +1,273 @@
+"""
+Watchlist alerts with fuzzy plate matching.
+
+OCR confuses characters like O/0 and I/1, so a watchlist plate has to match
+reads that differ from it. Distances are a weighted edit distance: swapping
+two confusable characters (util.dict_char_to_int pairs plus B/8, Z/2, D/0
+and Q/O) costs 1, any other substitution, insertion or deletion costs 2.
+The default threshold of 2 allows two confusions or one other error.
+
+Lookups never scan the list. Every plate is reduced to a canonical form
+with each confusion group collapsed to one character, so plates that only
+differ by confusions share a canonical form and are found with one dict
+lookup. On top of that, the canonical form and its single-character
+deletions are hashed into a sorted NumPy array, so the plates within one
+other edit are found with one searchsorted call. Only those candidates get
+the full distance. A read is checked against tens of thousands of plates
+in well under a millisecond.
+
+ANPR_WATCHLIST is a text file with one plate per line, optionally followed
+by a comma and a note; lines starting with # are ignored.
+
+    python watchlist.py watchlist.txt AB12CDE A8I2C0E
+"""
+import argparse
+import collections
+import os
+import threading
+import time
+
+import numpy as np
+
+import metrics
+from plate_store import normalize_plate
+from util import dict_char_to_int
+
+MAX_DISTANCE = int(os.environ.get('ANPR_WATCHLIST_MAX_DISTANCE', 2))
+
+# Pairs OCR mixes up beyond the ones format correction already handles
+EXTRA_CONFUSIONS = (('B', '8'), ('Z', '2'), ('D', '0'), ('Q', 'O'))
+
+WATCHLIST_HITS = metrics.Counter('anpr_watchlist_hits_total', 'Plate reads that matched a watchlist entry')
+
+
+def _confusion_groups():
+    """Merge confusable pairs into groups; every character maps to its group's first member"""
+    parent = {}
+
+    def find(char):
+        while parent.setdefault(char, char) != char:
+            char = parent[char]
+        return char
+
+    for a, b in list(dict_char_to_int.items()) + list(EXTRA_CONFUSIONS):
+        parent[find(b)] = find(a)
+    return {char: find(char) for char in parent}
+
+
+_GROUP = _confusion_groups()
+_CANONICAL = str.maketrans(_GROUP)
+
+
+def canonical(plate):
+    """Plate with every confusable character replaced by its group representative"""
+    return plate.translate(_CANONICAL)
+
+
+def plate_distance(a, b):
+    """Weighted edit distance: 1 per confusable substitution, 2 per other edit"""
+    previous = list(range(0, 2 * len(b) + 1, 2))
+    for i, char_a in enumerate(a, 1):
+        current = [2 * i]
+        group_a = _GROUP.get(char_a)
+        for j, char_b in enumerate(b, 1):
+            if char_a == char_b:
+                substitution = 0
+            elif group_a is not None and group_a == _GROUP.get(char_b):
+                substitution = 1
+            else:
+                substitution = 2
+            current.append(min(previous[j - 1] + substitution, previous[j] + 2, current[j - 1] + 2))
+        previous = current
+    return previous[-1]
+
+
+def _neighbourhood(key):
+    """The key and every string one deletion away from it"""
+    return {key} | {key[:i] + key[i + 1:] for i in range(len(key))}
+
+
+class Watchlist(object):
+    """
+    Fuzzy index over watchlist plates.
+
+    Args:
+        entries (iterable): Plates, or (plate, note) pairs.
+        max_distance (int): Largest plate_distance reported as a match. The deletion
+            index finds everything up to 2; higher values only widen the exact path.
+    """
+
+    def __init__(self, entries, max_distance=MAX_DISTANCE):
+        self.max_distance = max_distance
+        self.plates = []
+        self.notes = []
+        self._canonical = {}
+        hashes, ids = [], []
+        for entry in entries:
+            plate, note = (entry, None) if isinstance(entry, str) else entry
+            plate = normalize_plate(plate)
+            if not plate:
+                continue
+            i = len(self.plates)
+            self.plates.append(plate)
+            self.notes.append(note)
+            key = canonical(plate)
+            self._canonical.setdefault(key, []).append(i)
+            for variant in _neighbourhood(key):
+                hashes.append(hash(variant))
+                ids.append(i)
+        order = np.argsort(np.asarray(hashes, dtype=np.int64), kind='stable')
+        self._hashes = np.asarray(hashes, dtype=np.int64)[order]
+        self._ids = np.asarray(ids, dtype=np.int32)[order]
+
+    def __len__(self):
+        return len(self.plates)
+
+    @classmethod
+    def load(cls, path, max_distance=MAX_DISTANCE):
+        """Read a watchlist file: 'PLATE[,note]' per line, '#' comments"""
+        entries = []
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    plate, _, note = line.partition(',')
+                    entries.append((plate.strip(), note.strip() or None))
+        return cls(entries, max_distance=max_distance)
+
+    def match(self, text):
+        """
+        Watchlist plates close to a read.
+
+        Args:
+            text (str): Plate read.
+
+        Returns:
+            list: (plate, note, distance) tuples, closest first.
+        """
+        read = normalize_plate(text)
+        key = canonical(read)
+        # An exact or confusion-only hit doesn't end the search: other plates
+        # one edit away are within the threshold as well
+        candidates = set(self._canonical.get(key, ()))
+        queries = np.asarray([hash(variant) for variant in _neighbourhood(key)], dtype=np.int64)
+        starts = np.searchsorted(self._hashes, queries, side='left')
+        ends = np.searchsorted(self._hashes, queries, side='right')
+        candidates.update(int(i) for start, end in zip(starts, ends) if end > start for i in self._ids[start:end])
+        matches = self._distances(read, candidates)
+        matches.sort(key=lambda match: (match[2], match[0]))
+        return matches
+
+    def _distances(self, read, candidates):
+        matches = []
+        for i in candidates:
+            distance = plate_distance(read, self.plates[i])
+            if distance <= self.max_distance:
+                matches.append((self.plates[i], self.notes[i], distance))
+        return matches
+
+
+class WatchlistMonitor(object):
+    """
+    Check the reads of one video or stream and raise each hit once per track.
+
+    Args:
+        watchlist (Watchlist): Plates to look for.
+        source (str): Job or stream name put in events.
+        on_match (callable): Called with each event dict.
+        max_alerted (int): (track, plate) pairs remembered to suppress repeats.
+        max_events (int): Events kept in self.events; None keeps all of them.
+    """
+
+    def __init__(self, watchlist, source=None, on_match=None, max_alerted=10000, max_events=None):
+        self.watchlist = watchlist
+        self.source = source
+        self.on_match = on_match
+        self.max_alerted = max_alerted
+        self.events = collections.deque(maxlen=max_events)
+        self.hits = 0
+        self._alerted = collections.OrderedDict()
+
+    def check(self, car_id, frame_nmr, text, score):
+        """
+        Match one OCR read against the watchlist.
+
+        Returns:
+            list: Events raised for this read.
+        """
+        events = []
+        for plate, note, distance in self.watchlist.match(text):
+            alert_key = (car_id, plate)
+            if alert_key in self._alerted:
+                continue
+            self._alerted[alert_key] = True
+            if len(self._alerted) > self.max_alerted:
+                self._alerted.popitem(last=False)
+            event = {
+                'type': 'watchlist',
+                'source': self.source,
+                'plate': plate,
+                'note': note,
+                'read': text,
+                'distance': distance,
+                'text_score': score,
+                'car_id': int(car_id),
+                'frame_nmr': frame_nmr,
+                'time': time.time(),
+            }
+            self.hits += 1
+            WATCHLIST_HITS.inc()
+            print(f"Watchlist hit: {text} matches {plate} (distance {distance}) on car {int(car_id)}, "
+                  f"frame {frame_nmr} of {self.source}")
+            self.events.append(event)
+            events.append(event)
+            if self.on_match is not None:
+                self.on_match(event)
+        return events
+
+    def state(self):
+        """Picklable alert state, e.g. for a job checkpoint"""
+        return {'events': list(self.events), 'hits': self.hits, 'alerted': list(self._alerted)}
+
+    def restore(self, state):
+        """Continue from state(): earlier hits are kept and not raised again"""
+        self.events.extend(state['events'])
+        self.hits = state['hits']
+        self._alerted = collections.OrderedDict((tuple(key), True) for key in state['alerted'])
+
+
+_watchlist = None
+_watchlist_lock = threading.Lock()
+
+
+def get_watchlist():
+    """The watchlist in ANPR_WATCHLIST, loaded on first use; None when no file is configured"""
+    global _watchlist
+    path = os.environ.get('ANPR_WATCHLIST')
+    if _watchlist is None and path:
+        with _watchlist_lock:
+            if _watchlist is None:
+                _watchlist = Watchlist.load(path)
+                print(f"Loaded {len(_watchlist)} watchlist plates from {path}")
+    return _watchlist
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Match plate reads against a watchlist file')
+    parser.add_argument('watchlist', help="File with one 'PLATE[,note]' per line")
+    parser.add_argument('reads', nargs='+', help='Plate reads to check')
+    parser.add_argument('--max-distance', type=int, default=MAX_DISTANCE,
+                        help=f'Largest weighted edit distance reported [{MAX_DISTANCE}]')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    started_at = time.perf_counter()
+    watchlist = Watchlist.load(args.watchlist, max_distance=args.max_distance)
+    print(f"Indexed {len(watchlist)} plates in {time.perf_counter() - started_at:.2f}s")
+    for read in args.reads:
+        started_at = time.perf_counter()
+        matches = watchlist.match(read)
+        elapsed_ms = (time.perf_counter() - started_at) * 1000
+        print(f"{read}: {matches or 'no match'} ({elapsed_ms:.3f} ms)")